@@ -0,0 +1,158 @@
+# answer_cache.py
+"""
+Parse, result and narrative caches shared by the app, the API and the warmer.
+
+Each cache is an in-memory LRU (cte_planner.SharedResultCache) backed by files
+under ANSWER_CACHE_DIR, so a warm-up job run in another process (e.g. after
+scripts/load_duckdb_and_views.py) fills the cache the serving process reads.
+Result and narrative entries are namespaced by the data version, parses by
+the parser version (a hash of nl_parser.py).
+"""
+import hashlib
+import json
+import os
+import shutil
+
+from cte_planner import SharedResultCache
+from query_executor import current_db_path, data_version, run_template_get_arrow, extract_sources_from_sql
+
+ANSWER_CACHE_DIR = os.getenv("ANSWER_CACHE_DIR", "cache")
+ANSWER_CACHE_MAX_MB = float(os.getenv("ANSWER_CACHE_MAX_MB", "128"))
+
+_MB = 1024 * 1024
+RESULTS = SharedResultCache(int(ANSWER_CACHE_MAX_MB * _MB), sizeof=lambda v: v[1].nbytes + len(v[0]))
+NARRATIVES = SharedResultCache(8 * _MB, sizeof=len)
+PARSES = SharedResultCache(4 * _MB, sizeof=lambda v: len(json.dumps(v)))
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+def normalize_question(question: str) -> str:
+    return " ".join((question or "").lower().split())
+
+def params_key(template: str, params: dict) -> str:
+    """Stable key for a (template, params) combination, also used by the warmer's coverage report."""
+    return _sha(json.dumps([template, params or {}], sort_keys=True, ensure_ascii=False, default=str))
+
+def version_dir(version: str = None) -> str:
+    return os.path.join(ANSWER_CACHE_DIR, "v_" + _sha(version or data_version())[:16])
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+_parser_version = None
+
+def parser_version() -> str:
+    """Hash of nl_parser.py, so routing changes start a fresh parse cache."""
+    global _parser_version
+    if _parser_version is None:
+        import nl_parser
+        with open(nl_parser.__file__, "rb") as f:
+            _parser_version = hashlib.sha256(f.read()).hexdigest()[:16]
+    return _parser_version
+
+def parse_dir() -> str:
+    return os.path.join(ANSWER_CACHE_DIR, "parse", "p_" + parser_version())
+
+def cached_parse(question: str, rule_only: bool = False):
+    """
+    nl_parser.parse with memory + disk caching on the normalized question text.
+    Only rule-based parses are cached: the LLM fallback (and its canned default
+    when the LLM is offline or fails) is recomputed every time. With rule_only,
+    questions the rule-based parser cannot handle return None instead.
+    """
+    from nl_parser import rule_based_parse, llm_fallback_parse
+    key = _sha(normalize_question(question))
+    path = os.path.join(parse_dir(), key + ".json")
+
+    def compute():
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        parsed = rule_based_parse(question)
+        if parsed:
+            _write_atomic(path, json.dumps(parsed, ensure_ascii=False).encode("utf-8"))
+        return parsed
+
+    parsed = PARSES.get_or_compute((parser_version(), key), compute)
+    if parsed or rule_only:
+        return parsed
+    return llm_fallback_parse(question)
+
+def cached_results(template: str, params: dict, priority: str = "interactive"):
+    """run_template_get_arrow with memory + disk caching per data version. Returns (sql, table)."""
+    return cached_results_with_version(template, params, priority)[:2]
+
+def cached_results_with_version(template: str, params: dict, priority: str = "interactive"):
+    """cached_results that also returns the data version the table was read from: (sql, table, version)."""
+    import pyarrow as pa
+    # resolve the database version once so the result is stored under the version it was read from
+    db_path = current_db_path()
+    version = data_version(db_path)
+    key = params_key(template, params)
+    path = os.path.join(version_dir(version), "results", key + ".arrow")
+
+    def compute():
+        if os.path.exists(path):
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+            return table.schema.metadata[b"sql"].decode("utf-8"), table.replace_schema_metadata(None)
+        sql, table = run_template_get_arrow(template, params, priority, db_path=db_path)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, table.schema.with_metadata({"sql": sql})) as writer:
+            writer.write_table(table)
+        _write_atomic(path, sink.getvalue().to_pybytes())
+        return sql, table
+
+    sql, table = RESULTS.get_or_compute((version, key), compute)
+    return sql, table, version
+
+def cached_narrative(template: str, params: dict, table, sql: str, version: str = None):
+    """
+    narrative.compose_narrative with memory + disk caching per data version.
+    Pass the version the table was read from (see cached_results_with_version);
+    it defaults to the current one.
+    """
+    version = version or data_version()
+    key = params_key(template, params)
+    path = os.path.join(version_dir(version), "narratives", key + ".txt")
+
+    def compute():
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return f.read()
+        from narrative import compose_narrative
+        text = compose_narrative(template, table, params, extract_sources_from_sql(sql))
+        _write_atomic(path, text.encode("utf-8"))
+        return text
+
+    return NARRATIVES.get_or_compute((version, key), compute)
+
+def is_cached(template: str, params: dict, version: str = None) -> bool:
+    return os.path.exists(os.path.join(version_dir(version), "results", params_key(template, params) + ".arrow"))
+
+def prune_old_versions(keep_version: str = None):
+    """Delete on-disk result/narrative entries of data versions other than the current one, and stale parses."""
+    current = os.path.basename(version_dir(keep_version))
+    removed = 0
+    if os.path.isdir(ANSWER_CACHE_DIR):
+        for name in os.listdir(ANSWER_CACHE_DIR):
+            if name.startswith("v_") and name != current:
+                shutil.rmtree(os.path.join(ANSWER_CACHE_DIR, name), ignore_errors=True)
+                removed += 1
+    parses = os.path.join(ANSWER_CACHE_DIR, "parse")
+    if os.path.isdir(parses):
+        # parses of other parser versions, including the unversioned files of the old layout
+        current_parse = os.path.basename(parse_dir())
+        for name in os.listdir(parses):
+            if name != current_parse:
+                full = os.path.join(parses, name)
+                if os.path.isdir(full):
+                    shutil.rmtree(full, ignore_errors=True)
+                else:
+                    os.remove(full)
+    return removed
@@ -0,0 +1,108 @@
+# api.py
+"""
+HTTP API for the Q&A backend.
+Run:
+    uvicorn api:app --port 8000
+
+POST /query  {"question": "..."}  or  {"template": "sql_templates/...", "params": {...}}
+  -> Arrow IPC stream (application/vnd.apache.arrow.stream), written batch by
+     batch straight from the DuckDB cursor. Provenance travels in headers.
+
+GET /suggest?q=...&limit=8&kinds=state,crop,district,question
+  -> typeahead completions for the text typed so far (see suggest.py)
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Optional
+
+import duckdb
+import pyarrow as pa
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from query_executor import stream_template_batches, extract_sources_from_sql
+from resource_governor import AdmissionRejected, QueryTimeout, GOVERNOR
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+TEMPLATE_DIR = "sql_templates"
+
+app = FastAPI(title="Agri-Climate Q&A API")
+
+class QueryRequest(BaseModel):
+    question: Optional[str] = None
+    template: Optional[str] = None
+    params: dict = {}
+
+class _ChunkSink:
+    # file-like sink that hands each IPC message over instead of buffering the stream
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+def arrow_ipc_chunks(reader):
+    """Yield an Arrow IPC stream for `reader` one record batch at a time."""
+    sink = _ChunkSink()
+    with pa.ipc.new_stream(pa.PythonFile(sink, mode="w"), reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            yield b"".join(sink.chunks)
+            sink.chunks.clear()
+    yield b"".join(sink.chunks)  # end-of-stream marker
+
+@app.post("/query")
+def query(req: QueryRequest):
+    template, params = req.template, req.params
+    if req.question:
+        from nl_parser import parse
+        parsed = parse(req.question)
+        template, params = parsed.get("template"), parsed.get("params", {})
+    if not template:
+        raise HTTPException(status_code=400, detail="Provide a question or a template")
+    if os.path.dirname(os.path.normpath(template)) != TEMPLATE_DIR:
+        raise HTTPException(status_code=400, detail=f"Templates must live in {TEMPLATE_DIR}/")
+    try:
+        sql, reader = stream_template_batches(template, params)
+    except AdmissionRejected as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except QueryTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except (RuntimeError, OSError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        # str.format_map on a template placeholder the params did not fill
+        raise HTTPException(status_code=400, detail=f"Missing parameter: {e.args[0]}")
+    except duckdb.Error as e:
+        # catalog/parser/binder errors from bad params or templates over missing views
+        raise HTTPException(status_code=400, detail=str(e))
+    headers = {
+        "X-Template": template,
+        "X-Params": json.dumps(params, ensure_ascii=True),
+        "X-Sources": ",".join(extract_sources_from_sql(sql)),
+        "X-SQL-Hash": hashlib.sha256(sql.encode("utf-8")).hexdigest(),
+    }
+    return StreamingResponse(arrow_ipc_chunks(reader), media_type=ARROW_STREAM, headers=headers)
+
+@app.get("/suggest")
+def suggestions(q: str = "", limit: int = Query(8, ge=1, le=50), kinds: Optional[str] = None):
+    from suggest import suggest
+    t0 = time.perf_counter()
+    items = suggest(q, limit, kinds.split(",") if kinds else None)
+    return {"query": q, "suggestions": items, "took_ms": round((time.perf_counter() - t0) * 1000, 3)}
+
+@app.get("/governor")
+def governor():
+    return GOVERNOR.snapshot()
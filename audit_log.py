@@ -0,0 +1,38 @@
+# audit_log.py
+"""
+Append-only CSV audit log of answered questions (logs/audit.csv).
+"""
+import csv
+import os
+
+AUDIT_PATH = os.getenv("AUDIT_LOG_PATH", os.path.join("logs", "audit.csv"))
+
+def read_audit(path: str = AUDIT_PATH) -> list:
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+def append_audit(payload: dict, path: str = AUDIT_PATH):
+    """Append one row; if the payload adds new columns, the file is rewritten once with the wider header."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fieldnames = list(payload.keys())
+    if os.path.exists(path):
+        with open(path, newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f), [])
+        if header and not set(fieldnames) <= set(header):
+            rows = read_audit(path)
+            header = header + [k for k in fieldnames if k not in header]
+            tmp = path + ".tmp"
+            with open(tmp, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=header)
+                writer.writeheader()
+                writer.writerows(rows)
+            os.replace(tmp, path)
+        fieldnames = header or fieldnames
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+    with open(path, "a", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, restval="")
+        if write_header:
+            writer.writeheader()
+        writer.writerow(payload)
@@ -0,0 +1,158 @@
+# batch_answer.py
+"""
+Batch question answering over a JSONL file.
+
+Each input line is either {"id": ..., "question": "..."} or a bare JSON string.
+Questions are parsed, deduplicated on (template, params), grouped per template
+and each group is executed as multi-parameter queries on a process pool.
+
+Run:
+    python batch_answer.py questions.jsonl --out out/answers --workers 4
+Outputs:
+ - <out>.jsonl   one record per input line (answer text and rows, SQL, sources, timings)
+ - <out>.parquet same records, nested fields stored as JSON strings
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from nl_parser import parse
+from query_executor import run_template_batch, extract_sources_from_sql, MAX_PARAMS_PER_QUERY
+from narrative import compose_narrative
+
+def read_questions(path):
+    items = []
+    with open(path, "r", encoding="utf8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if isinstance(obj, str):
+                obj = {"question": obj}
+            q = (obj.get("question") or "").strip()
+            if not q:
+                continue
+            items.append({"id": obj.get("id", obj.get("request_id", lineno)), "question": q})
+    return items
+
+def params_key(template, params):
+    # canonical key used to deduplicate parsed questions
+    return template, json.dumps(params or {}, sort_keys=True, ensure_ascii=False)
+
+def _run_group(template, params_list):
+    # executed in a worker process: one connection, one query per template statement
+    t0 = time.perf_counter()
+    results = run_template_batch(template, params_list)
+    elapsed_ms = (time.perf_counter() - t0) * 1000
+    out = []
+    for sql, table, err in results:
+        rows = table.to_pylist() if table is not None else None
+        out.append({"sql": sql, "rows": rows, "error": err})
+    return out, elapsed_ms
+
+def run_batch(items, workers=None, polish=False):
+    # 1) parse, reusing the parse of identical question text
+    parsed_by_text, timings = {}, {}
+    for it in items:
+        q = it["question"]
+        if q in parsed_by_text:
+            continue
+        t0 = time.perf_counter()
+        try:
+            parsed_by_text[q] = parse(q)
+        except Exception as e:
+            parsed_by_text[q] = {"template": None, "params": {}, "error": f"parse failed: {e}"}
+        timings[q] = (time.perf_counter() - t0) * 1000
+
+    # 2) deduplicate on (template, params) and group by template
+    groups = {}  # template -> {params_key: params}
+    for p in parsed_by_text.values():
+        if p.get("template"):
+            groups.setdefault(p["template"], {})[params_key(p["template"], p.get("params"))] = p.get("params") or {}
+    n_unique = sum(len(g) for g in groups.values())
+    print(f"{len(items)} questions -> {len(parsed_by_text)} distinct texts -> {n_unique} distinct (template, params) in {len(groups)} templates")
+
+    # 3) execute groups (chunked so large groups spread over the pool)
+    answers = {}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for template, by_key in groups.items():
+            keys = list(by_key)
+            for start in range(0, len(keys), MAX_PARAMS_PER_QUERY):
+                chunk = keys[start:start + MAX_PARAMS_PER_QUERY]
+                fut = pool.submit(_run_group, template, [by_key[k] for k in chunk])
+                futures[fut] = chunk
+        for fut in as_completed(futures):
+            chunk = futures[fut]
+            try:
+                res, elapsed_ms = fut.result()
+            except Exception as e:
+                res, elapsed_ms = [{"sql": None, "rows": None, "error": str(e)}] * len(chunk), 0.0
+            for key, r in zip(chunk, res):
+                r["group_sql_ms"] = round(elapsed_ms, 2)
+                r["group_size"] = len(chunk)
+                answers[key] = r
+
+    # 4) fan results back out to every input line
+    records = []
+    for it in items:
+        p = parsed_by_text[it["question"]]
+        rec = {
+            "id": it["id"],
+            "question": it["question"],
+            "template": p.get("template"),
+            "params": p.get("params") or {},
+            "sql": None, "rows": None, "sources": [], "answer": None,
+            "error": p.get("error"),
+            "parse_ms": round(timings[it["question"]], 2),
+            "group_sql_ms": None, "group_size": None, "prompt_tokens": None,
+        }
+        if p.get("template"):
+            r = answers.get(params_key(p["template"], p.get("params")), {})
+            rec.update({k: r.get(k) for k in ("sql", "rows", "error", "group_sql_ms", "group_size")})
+            if rec["sql"]:
+                rec["sources"] = extract_sources_from_sql(rec["sql"])
+            if rec["rows"] is not None:
+                rec["answer"] = compose_narrative(rec["template"], rec["rows"], rec["params"], rec["sources"])
+                if polish and rec["rows"]:
+                    rec["answer"] = polish_answer(rec)
+        records.append(rec)
+    return records
+
+def polish_answer(rec):
+    from llm_adapter import llm_generate_short
+    from prompt_builder import build_narrative_prompt
+    prompt, stats = build_narrative_prompt(
+        rec["question"], rec["rows"], rec["sql"], rec["sources"], rec["template"], rec["params"], draft=rec["answer"]
+    )
+    rec["prompt_tokens"] = stats["prompt_tokens"]
+    return llm_generate_short(prompt, fallback=rec["answer"])
+
+def write_outputs(records, out_prefix):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    os.makedirs(os.path.dirname(out_prefix) or ".", exist_ok=True)
+    with open(out_prefix + ".jsonl", "w", encoding="utf8") as f:
+        for rec in records:
+            f.write(json.dumps(rec, ensure_ascii=False, default=str) + "\n")
+    flat = [
+        {**rec, "id": str(rec["id"]), **{k: json.dumps(rec[k], ensure_ascii=False, default=str) for k in ("params", "rows", "sources")}}
+        for rec in records
+    ]
+    pq.write_table(pa.Table.from_pylist(flat), out_prefix + ".parquet")
+    print("Wrote", out_prefix + ".jsonl", "and", out_prefix + ".parquet")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("--out", default="out/answers", help="output path prefix (without extension)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="process pool size")
+    parser.add_argument("--polish", action="store_true", help="polish each local narrative with the LLM (slow, needs network)")
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    records = run_batch(read_questions(args.input), workers=args.workers, polish=args.polish)
+    write_outputs(records, args.out)
+    print(f"Answered {len(records)} questions in {time.perf_counter() - t0:.2f}s")
@@ -0,0 +1,172 @@
+# cache_warmer.py
+"""
+Cache warm-up job.
+
+Mines logs/audit.csv for the most frequent (template, params) combinations,
+adds a configurable list of extra questions/combinations, and runs them in
+parallel so the parse, result and narrative caches (answer_cache) are filled
+before the first users arrive. Questions only the LLM parser can handle are
+skipped (their parses are never cached). Finishes with a coverage report: the share of
+last week's traffic that would have been a cache hit.
+
+Run:
+    python cache_warmer.py --top-k 50 --extra config/warm_questions.jsonl --workers 4
+Also run at the end of scripts/load_duckdb_and_views.py and on app start.
+Extra list format (JSONL): {"question": "..."} or {"template": "sql_templates/...", "params": {...}}
+"""
+import argparse
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from audit_log import read_audit, AUDIT_PATH
+from answer_cache import cached_parse, cached_results_with_version, cached_narrative, is_cached, prune_old_versions, normalize_question
+
+WARM_TOP_K = int(os.getenv("WARM_TOP_K", "50"))
+WARM_EXTRA_PATH = os.getenv("WARM_EXTRA_PATH", os.path.join("config", "warm_questions.jsonl"))
+WARM_WORKERS = int(os.getenv("WARM_WORKERS", "4"))
+
+def _ts(row):
+    try:
+        return datetime.fromisoformat(row.get("timestamp", "").rstrip("Z"))
+    except ValueError:
+        return None
+
+def _combo(row):
+    try:
+        params = json.loads(row.get("params") or "{}")
+    except json.JSONDecodeError:
+        return None
+    if not row.get("template"):
+        return None
+    return row["template"], json.dumps(params, sort_keys=True, ensure_ascii=False)
+
+def top_combinations(rows, k):
+    """Most frequent (template, params_json) pairs in the audit rows."""
+    counts = Counter(c for c in map(_combo, rows) if c)
+    return [c for c, _ in counts.most_common(k)]
+
+def top_questions(rows, k):
+    """Most frequent questions (by normalized text), keeping the first spelling seen."""
+    counts, first = Counter(), {}
+    for r in rows:
+        if not r.get("question"):
+            continue
+        n = normalize_question(r["question"])
+        counts[n] += 1
+        first.setdefault(n, r["question"])
+    return [first[n] for n, _ in counts.most_common(k)]
+
+def load_extra(path):
+    questions, combos = [], []
+    if not path or not os.path.exists(path):
+        return questions, combos
+    with open(path, encoding="utf8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            obj = json.loads(line)
+            if obj.get("question"):
+                questions.append(obj["question"])
+            elif obj.get("template"):
+                combos.append((obj["template"], json.dumps(obj.get("params") or {}, sort_keys=True, ensure_ascii=False)))
+    return questions, combos
+
+def _warm_question(question):
+    # never call the LLM from the background: its parses are not cached anyway
+    parsed = cached_parse(question, rule_only=True)
+    if not parsed:
+        return None
+    return parsed.get("template"), json.dumps(parsed.get("params") or {}, sort_keys=True, ensure_ascii=False)
+
+def _warm_combo(combo):
+    template, params_json = combo
+    params = json.loads(params_json)
+    sql, table, version = cached_results_with_version(template, params, priority="batch")
+    cached_narrative(template, params, table, sql, version)
+
+def warm(top_k=WARM_TOP_K, extra_path=WARM_EXTRA_PATH, workers=WARM_WORKERS, audit_path=AUDIT_PATH):
+    """Fill the caches; returns a summary dict."""
+    t0 = time.perf_counter()
+    rows = read_audit(audit_path)
+    extra_questions, extra_combos = load_extra(extra_path)
+    questions = list(dict.fromkeys(top_questions(rows, top_k) + extra_questions))
+    combos = list(dict.fromkeys(top_combinations(rows, top_k) + extra_combos))
+    failures, unparsed = [], 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # parses may add combinations the audit log never recorded
+        for q, res in zip(questions, pool.map(lambda q: _safe(_warm_question, q), questions)):
+            if isinstance(res, Exception):
+                failures.append(f"parse {q!r}: {res}")
+            elif res is None:
+                unparsed += 1
+            elif res[0] and res not in combos:
+                combos.append(res)
+        for c, res in zip(combos, pool.map(lambda c: _safe(_warm_combo, c), combos)):
+            if isinstance(res, Exception):
+                failures.append(f"{c[0]} {c[1]}: {res}")
+    pruned = prune_old_versions()
+    return {
+        "questions": len(questions),
+        "unparsed_questions": unparsed,
+        "combinations": len(combos),
+        "failures": failures,
+        "pruned_versions": pruned,
+        "seconds": round(time.perf_counter() - t0, 2),
+    }
+
+def _safe(fn, arg):
+    try:
+        return fn(arg)
+    except Exception as e:
+        return e
+
+def coverage(days=7, audit_path=AUDIT_PATH):
+    """
+    Share of the last `days` of traffic (ending at the newest audit entry)
+    whose (template, params) is now in the result cache.
+    """
+    rows = read_audit(audit_path)
+    stamped = [(r, _ts(r)) for r in rows]
+    stamped = [(r, ts) for r, ts in stamped if ts]
+    if not stamped:
+        return {"window_requests": 0, "hits": 0, "hit_rate": None}
+    end = max(ts for _, ts in stamped)
+    window = [r for r, ts in stamped if ts >= end - timedelta(days=days)]
+    hits = 0
+    for r in window:
+        c = _combo(r)
+        if c and is_cached(c[0], json.loads(c[1])):
+            hits += 1
+    return {
+        "window_start": (end - timedelta(days=days)).isoformat() + "Z",
+        "window_end": end.isoformat() + "Z",
+        "window_requests": len(window),
+        "hits": hits,
+        "hit_rate": round(hits / len(window), 3) if window else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top-k", type=int, default=WARM_TOP_K, help="most frequent combinations/questions to warm")
+    parser.add_argument("--extra", default=WARM_EXTRA_PATH, help="JSONL list of extra questions or template/params")
+    parser.add_argument("--workers", type=int, default=WARM_WORKERS)
+    parser.add_argument("--days", type=int, default=7, help="coverage window in days")
+    args = parser.parse_args()
+    summary = warm(args.top_k, args.extra, args.workers)
+    print(f"Warmed {summary['combinations']} combinations and {summary['questions']} questions in {summary['seconds']}s"
+          f" (pruned {summary['pruned_versions']} old cache versions)")
+    if summary["unparsed_questions"]:
+        print(f" skipped {summary['unparsed_questions']} questions that need the LLM parser")
+    for f in summary["failures"]:
+        print(" failed:", f)
+    cov = coverage(args.days)
+    if cov["window_requests"]:
+        print(f"Coverage: {cov['hits']}/{cov['window_requests']} requests in the last {args.days} days "
+              f"({cov['hit_rate']:.1%}) would have been cache hits")
+    else:
+        print("Coverage: no audited traffic in the window")
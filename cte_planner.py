@@ -0,0 +1,183 @@
+# cte_planner.py
+"""
+Shared-CTE planner for multi-statement templates.
+
+Templates repeat building blocks such as years_a / years_b / common_years in
+every statement. The planner finds named CTEs whose definition (including the
+CTEs they depend on) is identical in more than one statement, computes each
+of them once into an Arrow table and registers it on the connection, so the
+statements only keep the CTEs that are specific to them.
+
+Materialized CTEs live in a process-wide, byte-bounded LRU keyed by
+(data version, definition text), so concurrent requests with the same
+parameters share the result as well.
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+CTE_CACHE_MAX_MB = float(os.getenv("CTE_CACHE_MAX_MB", "64"))
+
+def _skip_parens(sql: str, i: int) -> int:
+    # sql[i] == "(" -> index just after the matching ")" (quotes respected)
+    depth, in_str = 0, False
+    while i < len(sql):
+        ch = sql[i]
+        if ch == "'":
+            in_str = not in_str
+        elif not in_str:
+            if ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+        i += 1
+    raise ValueError("unbalanced parentheses")
+
+_CTE_HEAD = re.compile(r"\s*([A-Za-z_][A-Za-z0-9_]*)\s+AS\s*\(", re.IGNORECASE)
+
+def split_ctes(stmt: str):
+    """Return ([(name, body), ...], main_query) for a WITH statement, else None."""
+    m = re.match(r"\s*WITH\s+", stmt, re.IGNORECASE)
+    if not m or re.match(r"\s*WITH\s+RECURSIVE\b", stmt, re.IGNORECASE):
+        return None
+    ctes, pos = [], m.end()
+    try:
+        while True:
+            h = _CTE_HEAD.match(stmt, pos)
+            if not h:
+                return None
+            open_idx = h.end() - 1
+            close_idx = _skip_parens(stmt, open_idx)
+            ctes.append((h.group(1), stmt[open_idx + 1:close_idx - 1].strip()))
+            rest = re.match(r"\s*,", stmt[close_idx:])
+            if not rest:
+                return ctes, stmt[close_idx:].strip()
+            pos = close_idx + rest.end()
+    except ValueError:
+        return None
+
+def _normalize(sql: str) -> str:
+    return re.sub(r"\s+", " ", sql).strip()
+
+def _refs(text: str, names) -> set:
+    return {n for n in names if re.search(rf"\b{re.escape(n)}\b", text, re.IGNORECASE)}
+
+def _closure(name: str, ctes: dict, order: list) -> list:
+    # the CTE plus everything it (transitively) depends on, in definition order
+    need, stack = set(), [name]
+    while stack:
+        n = stack.pop()
+        if n in need:
+            continue
+        need.add(n)
+        stack.extend(_refs(ctes[n], [o for o in order if o != n]))
+    return [n for n in order if n in need]
+
+def _with(names: list, ctes: dict, main: str) -> str:
+    if not names:
+        return main
+    return "WITH " + ",\n".join(f"{n} AS (\n{ctes[n]}\n)" for n in names) + "\n" + main
+
+def plan_statements(stmts: list) -> list:
+    """
+    Plan a template's statements. Returns one (statement_sql, materialize) pair
+    per statement, where materialize is a list of (name, definition_sql) that
+    must be registered on the connection before statement_sql runs.
+    """
+    parsed = [split_ctes(s) for s in stmts]
+    # definition text of every CTE, closed over its dependencies
+    defs = []
+    for p in parsed:
+        if p is None:
+            defs.append({})
+            continue
+        ctes, order = dict(p[0]), [n for n, _ in p[0]]
+        defs.append({n: _normalize(_with(_closure(n, ctes, order), ctes, f"SELECT * FROM {n}")) for n in order})
+    seen = {}
+    for d in defs:
+        for n, text in d.items():
+            seen.setdefault((n, text), 0)
+            seen[(n, text)] += 1
+    shared_keys = {k for k, c in seen.items() if c > 1}
+
+    plans = []
+    for stmt, p, d in zip(stmts, parsed, defs):
+        if p is None:
+            plans.append((stmt, []))
+            continue
+        ctes, main = dict(p[0]), p[1]
+        order = [n for n, _ in p[0]]
+        shared = {n for n in order if (n, d[n]) in shared_keys}
+        if not shared:
+            plans.append((stmt, []))
+            continue
+        # materialize the shared CTEs that the statement-specific parts use directly
+        consumers = [main] + [ctes[n] for n in order if n not in shared]
+        frontier = [n for n in order if n in shared and any(_refs(c, [n]) for c in consumers)]
+        # keep the non-shared CTEs still reachable once the frontier is materialized
+        keep, stack = set(), list(_refs(main, [n for n in order if n not in frontier]))
+        while stack:
+            n = stack.pop()
+            if n in keep:
+                continue
+            keep.add(n)
+            stack.extend(_refs(ctes[n], [o for o in order if o not in frontier and o != n]))
+        remaining = [n for n in order if n in keep]
+        plans.append((_with(remaining, ctes, main), [(n, d[n]) for n in frontier]))
+    return plans
+
+class SharedResultCache:
+    """Byte-bounded LRU (Arrow tables by default) with single-flight computation per key."""
+
+    def __init__(self, max_bytes: int, sizeof=lambda table: table.nbytes):
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self._items = OrderedDict()  # key -> (table, nbytes)
+        self._bytes = 0
+        self._inflight = {}  # key -> threading.Event
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get_or_compute(self, key, compute):
+        while True:
+            with self._lock:
+                if key in self._items:
+                    self._items.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return self._items[key][0]
+                waiter = self._inflight.get(key)
+                if waiter is None:
+                    # this caller computes; concurrent callers wait on the event
+                    self._inflight[key] = threading.Event()
+                    self.stats["misses"] += 1
+                    break
+            waiter.wait()
+        try:
+            table = compute()
+            self._put(key, table)
+            return table
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def _put(self, key, table):
+        nbytes = self.sizeof(table)
+        with self._lock:
+            if nbytes > self.max_bytes:
+                return
+            self._items[key] = (table, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, old) = self._items.popitem(last=False)
+                self._bytes -= old
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+CTE_CACHE = SharedResultCache(int(CTE_CACHE_MAX_MB * 1024 * 1024))
@@ -6,13 +6,19 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-# Try to import google genai SDK; if not available we will fail gracefully
-try:
-    from google import genai
-    from google.genai.errors import ServerError
-    SDK_AVAILABLE = True
-except Exception:
-    SDK_AVAILABLE = False
+# The google genai SDK is heavy to import, so it is loaded on the first real LLM call
+# (never in offline mode); if not available we will fail gracefully
+_genai = None
+
+def _load_sdk():
+    global _genai
+    if _genai is None:
+        try:
+            from google import genai
+            _genai = genai
+        except Exception:
+            _genai = False
+    return _genai
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 PRIMARY_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
@@ -44,7 +50,8 @@ def call_gemini_sdk(prompt: str, model: str, max_tokens: int = 512, temperature:
     Call the google-genai SDK and return textual output. Raises on hard failures.
     Retries on ServerError (503/overload).
     """
-    if not SDK_AVAILABLE:
+    genai = _load_sdk()
+    if not genai:
         raise RuntimeError("google-genai SDK not installed (pip install google-genai).")
 
     if not GEMINI_API_KEY:
@@ -99,13 +106,14 @@ def call_gemini_sdk(prompt: str, model: str, max_tokens: int = 512, temperature:
     # All attempts failed
     raise RuntimeError(f"All model attempts failed. Last exception: {repr(last_exc)}")
 
-def llm_generate_short(prompt: str) -> str:
+def llm_generate_short(prompt: str, fallback: str = None) -> str:
     """
     Safe wrapper for Streamlit. Attempts Gemini SDK; on failure returns deterministic fallback text.
+    `fallback` (e.g. the narrative.compose_narrative text) is returned instead of the canned summary when given.
     """
     # Respect offline mode to avoid any external calls
     if os.getenv("OFFLINE", "0") == "1":
-        return _local_fallback_summary(prompt)
+        return fallback if fallback is not None else _local_fallback_summary(prompt)
     try:
         # prefer primary model
         return call_gemini_sdk(prompt, model=PRIMARY_MODEL, max_tokens=512, temperature=0.1)
@@ -113,4 +121,4 @@ def llm_generate_short(prompt: str) -> str:
         # print helpful debug info to console
         print("LLM call failed:", repr(e))
         # return a deterministic fallback summary rather than crashing
-        return _local_fallback_summary(prompt)
+        return fallback if fallback is not None else _local_fallback_summary(prompt)
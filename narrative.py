@@ -0,0 +1,238 @@
+# narrative.py
+"""
+Deterministic narrative generator.
+
+Turns a template's result set into a few cited sentences without any network
+call. Every number in the text comes from the result rows; each sentence is
+followed by the view it was computed from, e.g. "(source: state_year_rain)".
+The LLM is only an optional polish step on top of this text.
+"""
+import math
+import os
+
+def _rows(result):
+    # accept a pyarrow Table, a pandas DataFrame or a list of dicts
+    if result is None:
+        return []
+    if hasattr(result, "to_pylist"):
+        return result.to_pylist()
+    if hasattr(result, "to_dict"):
+        return result.to_dict(orient="records")
+    return list(result)
+
+def _num(v):
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(f) else f
+
+def fmt_num(v, unit: str = "") -> str:
+    f = _num(v)
+    if f is None:
+        return "n/a"
+    a = abs(f)
+    if a >= 1e6:
+        s = f"{f / 1e6:,.1f} million"
+    elif a >= 1e3:
+        s = f"{f:,.0f}"
+    elif a >= 10:
+        s = f"{f:,.1f}".rstrip("0").rstrip(".")
+    else:
+        s = f"{f:,.2f}".rstrip("0").rstrip(".")
+    return f"{s} {unit}".strip()
+
+def _pct(a, b):
+    # relative difference of a over b, in percent
+    a, b = _num(a), _num(b)
+    if a is None or not b:
+        return None
+    return (a - b) / abs(b) * 100
+
+def _join(items):
+    items = list(items)
+    if len(items) <= 1:
+        return "".join(items)
+    return ", ".join(items[:-1]) + " and " + items[-1]
+
+def _cite(view, sources):
+    # cite the view the number came from; fall back to what the SQL actually read
+    if not sources or view in sources:
+        return f"(source: {view})"
+    return f"(source: {sources[0]})"
+
+def _linear_slope(xs, ys):
+    n = len(xs)
+    mx, my = sum(xs) / n, sum(ys) / n
+    sxx = sum((x - mx) ** 2 for x in xs)
+    return sum((x - mx) * (y - my) for x, y in zip(xs, ys)) / sxx if sxx else 0.0
+
+def _pearson(xs, ys):
+    n = len(xs)
+    if n < 3:
+        return None
+    mx, my = sum(xs) / n, sum(ys) / n
+    sxy = sum((x - mx) * (y - my) for x, y in zip(xs, ys))
+    sxx = sum((x - mx) ** 2 for x in xs)
+    syy = sum((y - my) ** 2 for y in ys)
+    if not sxx or not syy:
+        return None
+    return sxy / math.sqrt(sxx * syy)
+
+def _strength(r):
+    a = abs(r)
+    word = "very weak" if a < 0.2 else "weak" if a < 0.4 else "moderate" if a < 0.6 else "strong" if a < 0.8 else "very strong"
+    return f"{word} {'positive' if r > 0 else 'negative'}"
+
+def _rain_compare(rows, params, sources):
+    rain = [r for r in rows if r.get("metric") == "rainfall" and _num(r.get("avg_rain_mm")) is not None]
+    crops = [r for r in rows if r.get("metric") == "top_crops"]
+    out = []
+    if rain:
+        years = int(max(_num(r.get("years_count")) or 0 for r in rain))
+        span = f"Over the {years} most recent years with data for all states" if years else "Over the common years"
+        rain = sorted(rain, key=lambda r: -_num(r["avg_rain_mm"]))
+        parts = [f"{fmt_num(r['avg_rain_mm'], 'mm')} in {r['State']}" for r in rain]
+        out.append(f"{span}, average annual rainfall was {_join(parts)} {_cite('state_year_rain', sources)}.")
+        if len(rain) >= 2:
+            hi, lo = rain[0], rain[-1]
+            diff = _pct(hi["avg_rain_mm"], lo["avg_rain_mm"])
+            if diff is not None:
+                out.append(f"{hi['State']} received about {diff:.0f}% more rain than {lo['State']} {_cite('state_year_rain', sources)}.")
+    # list-valued STATES (q7_compare_states.sql): say which requested states had no rainfall rows
+    missing = [s for s in params.get("STATES") or [] if s not in {r.get("State") for r in rain}]
+    if missing:
+        out.append(f"No rainfall data was found for {_join(missing)}, so {'it is' if len(missing) == 1 else 'they are'} not part of this comparison {_cite('state_year_rain', sources)}.")
+    by_state = {}
+    for r in crops:
+        by_state.setdefault(r.get("State"), []).append(r)
+    for state, rs in by_state.items():
+        rs = sorted(rs, key=lambda r: -(_num(r.get("total_prod_tonnes")) or 0))
+        parts = [f"{r['Crop']} ({fmt_num(r.get('total_prod_tonnes'), 'tonnes')})" for r in rs]
+        out.append(f"In {state}, the top {len(rs)} crops by total production over the same years were {_join(parts)} {_cite('crop_state_year', sources)}.")
+    return out
+
+def _trend_corr(rows, params, sources, rain_label="Annual rainfall", rain_view="state_year_rain"):
+    rows = sorted(
+        (r for r in rows if _num(r.get("production")) is not None and _num(r.get("rainfall")) is not None),
+        key=lambda r: r["Year"],
+    )
+    if not rows:
+        return []
+    crop = params.get("CROP_NAME") or "Crop"
+    state = params.get("STATE") or "the state"
+    years = [int(r["Year"]) for r in rows]
+    prod = [_num(r["production"]) for r in rows]
+    rain = [_num(r["rainfall"]) for r in rows]
+    first, last = rows[0], rows[-1]
+    change = _pct(prod[-1], prod[0])
+    direction = "rose" if prod[-1] > prod[0] else "fell" if prod[-1] < prod[0] else "was unchanged"
+    out = [
+        f"{crop.title()} production in {state} {direction} from {fmt_num(prod[0], 'tonnes')} in {first['Year']} "
+        f"to {fmt_num(prod[-1], 'tonnes')} in {last['Year']}"
+        + (f" ({change:+.1f}%)" if change is not None and direction != "was unchanged" else "")
+        + f" {_cite('crop_state_year', sources)}."
+    ]
+    if len(rows) >= 3:
+        slope = _linear_slope(years, prod)
+        sign = "+" if slope > 0 else ""
+        out.append(f"The fitted linear trend is {sign}{fmt_num(slope, 'tonnes')} per year across {len(rows)} years {_cite('crop_state_year', sources)}.")
+    wet = max(rows, key=lambda r: _num(r["rainfall"]))
+    dry = min(rows, key=lambda r: _num(r["rainfall"]))
+    out.append(
+        f"{rain_label} ranged from {fmt_num(dry['rainfall'], 'mm')} in {dry['Year']} "
+        f"to {fmt_num(wet['rainfall'], 'mm')} in {wet['Year']} {_cite(rain_view, sources)}."
+    )
+    r = _pearson(rain, prod)
+    if r is not None:
+        out.append(
+            f"Year-to-year production and {rain_label[0].lower() + rain_label[1:]} show a {_strength(r)} correlation (r = {r:.2f}, n = {len(rows)}), "
+            "which on its own does not establish that rainfall drives production."
+        )
+    return out
+
+SEASON_LABELS = {
+    "winter": "Winter (Jan-Feb) rainfall",
+    "pre_monsoon": "Pre-monsoon (Mar-May) rainfall",
+    "monsoon": "Monsoon (Jun-Sep) rainfall",
+    "post_monsoon": "Post-monsoon (Oct-Dec) rainfall",
+    "kharif": "Kharif-season (Jun-Oct) rainfall",
+    "rabi": "Rabi-season (Oct-Mar) rainfall",
+    "annual": "Annual rainfall",
+}
+
+def _season_corr(rows, params, sources):
+    season = params.get("SEASON") or rows[0].get("season") or "annual"
+    label = SEASON_LABELS.get(str(season).lower(), f"{str(season).replace('_', ' ').capitalize()} rainfall")
+    return _trend_corr(rows, params, sources, rain_label=label, rain_view="state_season_rain")
+
+def _district_high_low(rows, params, sources):
+    crop = (params.get("CROP_NAME") or "the crop").title()
+    out = []
+    for r in rows:
+        value = r.get("top_district_prod")
+        state = params.get("STATE_HIGH") if r.get("which") == "high" else params.get("STATE_LOW")
+        if not value:
+            out.append(f"No district-level {crop} production was found for {state or 'the state'}.")
+            continue
+        district, _, prod = str(value).rpartition("|")
+        label = "highest" if r.get("which") == "high" else "lowest"
+        out.append(
+            f"In {r.get('year_used')}, the {label}-producing {crop} district in {state or 'the state'} was "
+            f"{district} with {fmt_num(prod, 'tonnes')} {_cite('district_year_crop', sources)}."
+        )
+    return out
+
+def _policy_args(rows, params, sources):
+    out = []
+    period = f" over the last {params['N_YEARS']} common years" if params.get("N_YEARS") else ""
+    for r in rows:
+        prod, area = _num(r.get("total_prod")), _num(r.get("total_area"))
+        yld = f", a yield of {fmt_num(prod / area, 't/ha')}" if prod is not None and area else ""
+        out.append(
+            f"{r.get('Crop')} in {params.get('STATE', 'the state')} produced {fmt_num(prod, 'tonnes')}{period} "
+            f"on {fmt_num(area, 'ha')}{yld} {_cite('crop_state_year', sources)}."
+        )
+    rain = next((_num(r.get("avg_rain_mm")) for r in rows if _num(r.get("avg_rain_mm")) is not None), None)
+    if rain is not None:
+        out.append(f"Average annual rainfall over the same years was {fmt_num(rain, 'mm')} {_cite('state_year_rain', sources)}.")
+    return out
+
+def _district_vs_state(rows, params, sources):
+    out = []
+    for r in rows:
+        diff = _pct(r.get("district_mm"), r.get("avg_state_mm"))
+        cmp = f", {abs(diff):.0f}% {'above' if diff >= 0 else 'below'} the state average" if diff is not None else ""
+        out.append(
+            f"In {r.get('Year')}, {r.get('District')} received {fmt_num(r.get('district_mm'), 'mm')} of rain "
+            f"against a {r.get('State')} average of {fmt_num(r.get('avg_state_mm'), 'mm')}{cmp} {_cite('state_year_rain', sources)}."
+        )
+    return out
+
+def _generic(rows, params, sources):
+    cols = ", ".join(rows[0].keys()) if rows else ""
+    src = f" {_cite(sources[0], sources)}" if sources else ""
+    return [f"The query returned {len(rows)} row{'s' if len(rows) != 1 else ''} with columns {cols}{src}."]
+
+# template file name -> narrative builder
+NARRATIVES = {
+    "q1_avg_rain_top_crops.sql": _rain_compare,
+    "q2_district_high_low.sql": _district_high_low,
+    "q3_trend_corr.sql": _trend_corr,
+    "q4_policy_args.sql": _policy_args,
+    "q5_district_vs_state_2018.sql": _district_vs_state,
+    "q6_season_corr.sql": _season_corr,
+    "q7_compare_states.sql": _rain_compare,
+}
+
+def compose_narrative(template_path: str, result, params: dict = None, sources: list = None) -> str:
+    """Compose a short cited answer from a result set (Arrow table, DataFrame or rows)."""
+    rows = _rows(result)
+    if not rows:
+        return "No results were returned for this question, so there is nothing to summarize."
+    builder = NARRATIVES.get(os.path.basename(template_path or ""), _generic)
+    try:
+        sentences = builder(rows, params or {}, list(sources or []))
+    except Exception:
+        sentences = []
+    return " ".join(sentences or _generic(rows, params or {}, list(sources or [])))
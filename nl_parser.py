@@ -15,8 +15,24 @@ TEMPLATES = {
     "trend_corr": "sql_templates/q3_trend_corr.sql",
     "policy_args": "sql_templates/q4_policy_args.sql",
     "district_vs_state": "sql_templates/q5_district_vs_state_2018.sql",
+    "season_corr": "sql_templates/q6_season_corr.sql",
+    "compare_states": "sql_templates/q7_compare_states.sql",
 }
 
+# example phrasing per template, offered as typeahead completions (see suggest.py)
+QUESTION_SHAPES = {
+    "compare_rain_and_top_crops": "Compare the average annual rainfall in <state> and <state> for the last <n> years and list the top <m> cereals in each state",
+    "district_high_low": "Which district in <state> had the highest production of <crop>, and which district in <state> had the lowest?",
+    "trend_corr": "Analyze the production trend of <crop> in <state> over the last <n> years and its correlation with rainfall",
+    "policy_args": "Give data-backed arguments for promoting <crop> over <crop> in <state>",
+    "district_vs_state": "Compare <crop> production in <district> with the <state> average",
+    "season_corr": "How does <season> rainfall correlate with <crop> production in <state> over the last <n> years?",
+    "compare_states": "Compare rainfall across <state>, <state>, <state> and <state> for the last <n> years with the top <m> crops in each",
+}
+
+# common abbreviations -> canonical state names
+STATE_ALIASES = {"UP": "Uttar Pradesh", "MP": "Madhya Pradesh", "HP": "Himachal Pradesh", "AP": "Andhra Pradesh", "WB": "West Bengal", "TN": "Tamil Nadu", "J&K": "Jammu and Kashmir"}
+
 # simple entity extraction heuristics
 def extract_states(text):
     # naive list: you can load canonical states from crop_state_year table for better matching
@@ -26,6 +42,10 @@ def extract_states(text):
     for s in STATES:
         if s.lower() in text_low:
             found.append(s)
+    # abbreviations only count as whole upper-case words ("UP", not "up")
+    for abbr, s in STATE_ALIASES.items():
+        if re.search(rf"(?<![\w&]){re.escape(abbr)}(?![\w&])", text):
+            found.append(s)
     return list(dict.fromkeys(found))  # unique preserve order
 
 def extract_years(text):
@@ -42,6 +62,26 @@ def extract_numbers(text):
     top_m = int(m2.group(1)) if m2 else None
     return last_n, top_m
 
+# question wording -> Season value of state_season_rain
+SEASON_WORDS = [
+    (r"pre[- ]?monsoon", "pre_monsoon"),
+    (r"post[- ]?monsoon", "post_monsoon"),
+    (r"monsoon|jjas", "monsoon"),
+    (r"kharif", "kharif"),
+    (r"rabi", "rabi"),
+    (r"winter", "winter"),
+]
+# growing season of common crops, used for "seasonal rainfall" questions without a named season
+CROP_SEASON = {"rice": "kharif", "maize": "kharif", "bajra": "kharif", "jowar": "kharif", "ragi": "kharif", "wheat": "rabi"}
+
+def extract_season(text, crop=""):
+    for pattern, season in SEASON_WORDS:
+        if re.search(pattern, text, re.I):
+            return season
+    if re.search(r"season", text, re.I):
+        return CROP_SEASON.get(crop.lower(), "kharif")
+    return None
+
 def rule_based_parse(question: str) -> Optional[Dict]:
     q = question.lower()
     # Q1-like: compare average rainfall STATE_X and STATE_Y for the last N years + top M cereals
@@ -52,7 +92,18 @@ def rule_based_parse(question: str) -> Optional[Dict]:
         cereal_filter = ""
         if "cereal" in q or "cereals" in q:
             cereal_filter = "AND Crop IN ('Wheat','Rice','Maize')"
-        if len(states) >= 2:
+        if len(states) > 2:
+            # any number of states in one query; sorted so the same set always gives the same params
+            return {
+                "template": TEMPLATES["compare_states"],
+                "params": {
+                    "STATES": sorted(states),
+                    "N_YEARS": last_n or 10,
+                    "TOP_M": top_m or 3,
+                    "CEREAL_WHERE": cereal_filter
+                }
+            }
+        if len(states) == 2:
             return {
                 "template": TEMPLATES["compare_rain_and_top_crops"],
                 "params": {
@@ -68,11 +119,19 @@ def rule_based_parse(question: str) -> Optional[Dict]:
         states = extract_states(question)
         yrs = extract_years(question)
         last_n, _ = extract_numbers(question)
+        crop = re.findall(r"rice|wheat|maize|bajra|jowar|ragi", question, re.I)[0] if re.search(r"rice|wheat|maize|bajra|jowar|ragi", question, re.I) else ""
+        season = extract_season(question, crop)
+        if season:
+            # season-aligned variant: production against that season's rainfall
+            return {
+                "template": TEMPLATES["season_corr"],
+                "params": {"STATE": states[0] if states else "Punjab", "CROP_NAME": crop, "SEASON": season, "N_YEARS": last_n or 8}
+            }
         return {
             "template": TEMPLATES["trend_corr"],
             "params": {
                 "STATE": states[0] if states else "Punjab",
-                "CROP_NAME": re.findall(r"rice|wheat|maize|bajra|jowar|ragi", question, re.I)[0] if re.search(r"rice|wheat|maize|bajra|jowar|ragi", question, re.I) else "",
+                "CROP_NAME": crop,
                 "N_YEARS": last_n or 8
             }
         }
@@ -83,7 +142,7 @@ def llm_fallback_parse(question: str) -> Dict:
     """
     Ask the LLM to return a JSON-like mapping:
     {
-      "template_key": "<one of compare_rain_and_top_crops|district_high_low|trend_corr|policy_args|district_vs_state>",
+      "template_key": "<one of compare_rain_and_top_crops|district_high_low|trend_corr|policy_args|district_vs_state|season_corr|compare_states>",
       "params": {"STATE_A":"Punjab", ...}
     }
     Keep the prompt explicit and strict about returning only JSON.
@@ -91,8 +150,8 @@ def llm_fallback_parse(question: str) -> Dict:
     prompt = f"""
 You are a strict parser. Given a user question about agriculture and climate, return ONLY a JSON object (no explanation).
 The JSON should contain:
-- template_key: one of compare_rain_and_top_crops, district_high_low, trend_corr, policy_args, district_vs_state
-- params: a dictionary of parameters to substitute into the SQL template.
+- template_key: one of compare_rain_and_top_crops, district_high_low, trend_corr, policy_args, district_vs_state, season_corr, compare_states
+- params: a dictionary of parameters to substitute into the SQL template (for compare_states, STATES is a JSON list of state names).
 
 Question: \"\"\"{question}\"\"\"
 
@@ -0,0 +1,122 @@
+# prompt_builder.py
+"""
+Token-budgeted prompt construction for narrative composition.
+
+Facts are serialized column by column with rounded numbers, the SQL is
+replaced by a one-line template descriptor (or comment-free compact SQL), and
+rows are sampled or pre-aggregated until the estimated prompt size fits
+PROMPT_TOKEN_BUDGET. Token counts are estimated locally (~4 chars per token).
+"""
+import math
+import os
+import re
+
+from narrative import _rows
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "700"))
+CHARS_PER_TOKEN = 4
+SIG_DIGITS = 4
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def compact_sql(sql: str) -> str:
+    from query_executor import strip_sql_comments
+    return re.sub(r"\s+", " ", strip_sql_comments(sql)).strip()
+
+def template_descriptor(template_path: str, params: dict) -> str:
+    name = os.path.splitext(os.path.basename(template_path or "query"))[0]
+    args = ", ".join(f"{k}={v}" for k, v in (params or {}).items() if v not in ("", None))
+    return f"{name}({args})"
+
+def _fmt(v):
+    if v is None:
+        return ""
+    if isinstance(v, float):
+        if math.isnan(v):
+            return ""
+        return f"{v:.{SIG_DIGITS}g}"
+    return str(v)
+
+def columnar_facts(rows: list) -> str:
+    """One line per column: `name: v1|v2|...`; constant columns collapse, all-empty ones are dropped."""
+    if not rows:
+        return "(no rows)"
+    cols = list(dict.fromkeys(k for r in rows for k in r))
+    lines = []
+    for c in cols:
+        vals = [_fmt(r.get(c)) for r in rows]
+        if not any(vals):
+            continue
+        if len(rows) > 1 and len(set(vals)) == 1:
+            lines.append(f"{c}: {vals[0]} (all rows)")
+        else:
+            lines.append(f"{c}: " + "|".join(vals))
+    return "\n".join(lines)
+
+def aggregate_facts(rows: list) -> str:
+    """Per-column summary used when even a sample does not fit the budget."""
+    cols = list(dict.fromkeys(k for r in rows for k in r))
+    lines = [f"rows: {len(rows)}"]
+    for c in cols:
+        vals = [r.get(c) for r in rows if r.get(c) is not None]
+        nums = [v for v in vals if isinstance(v, (int, float)) and not (isinstance(v, float) and math.isnan(v))]
+        if nums and len(nums) == len(vals):
+            lines.append(f"{c}: min={_fmt(float(min(nums)))} max={_fmt(float(max(nums)))} mean={_fmt(sum(nums) / len(nums))}")
+        elif vals:
+            distinct = list(dict.fromkeys(map(str, vals)))
+            lines.append(f"{c}: {len(distinct)} distinct (" + "|".join(distinct[:8]) + ("|..." if len(distinct) > 8 else "") + ")")
+    return "\n".join(lines)
+
+def _sample(rows: list, k: int) -> list:
+    # evenly spaced rows, always keeping the first and the last
+    if k >= len(rows):
+        return rows
+    if k <= 1:
+        return rows[:1]
+    step = (len(rows) - 1) / (k - 1)
+    return [rows[round(i * step)] for i in range(k)]
+
+_PROMPT = """You are an assistant that polishes short factual summaries for a Q&A app.
+Do NOT invent numbers. Use ONLY the facts (columnar: `column: v1|v2|...`, one value per row) and the draft answer.
+question: {question}
+query: {query}
+sources: {sources}
+facts ({facts_note}):
+{facts}
+draft: {draft}
+Rewrite the draft as a short answer (3-6 sentences). After each numeric claim, keep a parenthetical citation like (source: <view-name>). Only use these sources: {sources}.
+Return only text."""
+
+def build_narrative_prompt(question: str, result, sql: str, sources: list, template: str = None,
+                           params: dict = None, draft: str = "", budget: int = None, include_sql: bool = False):
+    """
+    Build the LLM prompt for `result` within `budget` tokens.
+    Returns (prompt, stats) where stats records the estimated size and how facts were reduced.
+    """
+    budget = budget or PROMPT_TOKEN_BUDGET
+    rows = _rows(result)
+    query = compact_sql(sql) if include_sql or not template else template_descriptor(template, params)
+
+    def render(facts, note):
+        return _PROMPT.format(question=question, query=query, sources=", ".join(sources or []),
+                              facts=facts, facts_note=note, draft=draft or "")
+
+    mode, k = "full", len(rows)
+    prompt = render(columnar_facts(rows), f"all {len(rows)} rows")
+    while estimate_tokens(prompt) > budget and k > 4:
+        k = max(4, k // 2)
+        mode = "sampled"
+        prompt = render(columnar_facts(_sample(rows, k)), f"{k} of {len(rows)} rows, evenly sampled")
+    if estimate_tokens(prompt) > budget and rows:
+        mode, k = "aggregated", 0
+        prompt = render(aggregate_facts(rows), "per-column summary")
+    stats = {
+        "prompt_tokens": estimate_tokens(prompt),
+        "prompt_chars": len(prompt),
+        "rows_in": len(rows),
+        "rows_sent": k,
+        "facts_mode": mode,
+        "budget": budget,
+    }
+    return prompt, stats
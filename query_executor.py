@@ -1,15 +1,33 @@
 # query_executor.py
 import duckdb, os
 import re
+import sys
+import weakref
+from collections import Counter
+from contextlib import ExitStack
 from dotenv import load_dotenv
 load_dotenv()
 DB = os.getenv("DUCKDB_PATH","data/agri_climate.duckdb")
+# written by scripts/load_duckdb_and_views.py: names the database version to serve
+DB_POINTER = os.getenv("DUCKDB_POINTER", os.path.splitext(DB)[0] + ".current")
 from pathlib import Path
+from cte_planner import plan_statements, CTE_CACHE
+from resource_governor import GOVERNOR, budget_for, QUERY_THREADS, QUERY_MEMORY_LIMIT
 
-def run_template_get_results(template_path: str, params: dict):
-    # read template, substitute with str.format_map
-    with open(template_path, 'r', encoding='utf8') as f:
-        sql_raw = f.read()
+# upper bound on param sets folded into one multi-parameter query (keeps SQL text small)
+MAX_PARAMS_PER_QUERY = int(os.getenv("MAX_PARAMS_PER_QUERY", "64"))
+# rows per record batch when streaming results
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "10000"))
+# params rendered as a quoted SQL list for IN (...); every other key must be a scalar
+LIST_PARAMS = {"STATES"}
+# list-valued params (e.g. STATES for q7_compare_states.sql) hold at most this many items
+MAX_LIST_PARAM_ITEMS = int(os.getenv("MAX_LIST_PARAM_ITEMS", "36"))
+# cap on per-state ranking params so N-state results stay bounded
+MAX_TOP_M = int(os.getenv("MAX_TOP_M", "25"))
+# Season values of the state_season_rain / subdivision_season_rain rollups (see scripts/load_duckdb_and_views.py)
+RAIN_SEASONS = ("winter", "pre_monsoon", "monsoon", "post_monsoon", "kharif", "rabi", "annual")
+
+def _sanitize_params(params: dict) -> dict:
     # validate and sanitize params before formatting
     safe_params = {}
     # allowlisted simple validators
@@ -17,9 +35,24 @@ def run_template_get_results(template_path: str, params: dict):
     ident_pattern = re.compile(r"^[A-Za-z0-9_./]{1,64}$")
     int_pattern = re.compile(r"^\d{1,3}$")
     for k, v in (params or {}).items():
+        if isinstance(v, bool):
+            raise RuntimeError(f"Unsupported parameter type for {k}")
         if isinstance(v, int):
+            if k.upper() == "TOP_M" and v > MAX_TOP_M:
+                raise RuntimeError(f"{k} must be at most {MAX_TOP_M}")
             safe_params[k] = v
             continue
+        if (k in LIST_PARAMS) != isinstance(v, (list, tuple)):
+            # a list in a scalar '{KEY}' slot (or a scalar in an IN ({KEY}) slot) would break the quoting
+            raise RuntimeError(f"{k} must be {'a list' if k in LIST_PARAMS else 'a single value'}")
+        if isinstance(v, (list, tuple)):
+            items = list(dict.fromkeys(v))
+            if not items or len(items) > MAX_LIST_PARAM_ITEMS:
+                raise RuntimeError(f"{k} needs 1 to {MAX_LIST_PARAM_ITEMS} values")
+            if not all(isinstance(i, str) and state_pattern.match(i) for i in items):
+                raise RuntimeError(f"Invalid value in list parameter: {k}")
+            safe_params[k] = ",".join("'" + i.replace("'", "''") + "'" for i in items)
+            continue
         if isinstance(v, str):
             # heuristic by param name
             if k.upper().startswith("STATE"):
@@ -31,14 +64,20 @@ def run_template_get_results(template_path: str, params: dict):
                 if not state_pattern.match(v):
                     raise RuntimeError(f"Invalid crop parameter: {k}")
                 safe_params[k] = v.replace("'", "''")
+            elif k.upper() == "SEASON":
+                if v.lower() not in RAIN_SEASONS:
+                    raise RuntimeError(f"Invalid season: {v} (expected one of {', '.join(RAIN_SEASONS)})")
+                safe_params[k] = v.lower()
             elif k.upper() in ("CEREAL_WHERE",):
                 # restrict to a small safe pattern: only letters, commas, spaces, quotes, parentheses and = _
-                if not re.fullmatch(r"[A-Za-z0-9_(),' =]+", v or ""):
+                if v and not re.fullmatch(r"[A-Za-z0-9_(),' =]+", v):
                     raise RuntimeError("Invalid filter expression")
                 safe_params[k] = v
             elif k.upper().endswith("YEARS") or k.upper().startswith("TOP_") or k.upper() in ("N_YEARS", "TOP_M"):
                 if not int_pattern.match(str(v)):
                     raise RuntimeError(f"Invalid integer parameter: {k}")
+                if k.upper() == "TOP_M" and int(v) > MAX_TOP_M:
+                    raise RuntimeError(f"{k} must be at most {MAX_TOP_M}")
                 safe_params[k] = int(v)
             else:
                 # default to identifier-safe
@@ -47,16 +86,249 @@ def run_template_get_results(template_path: str, params: dict):
                 safe_params[k] = v
         else:
             raise RuntimeError(f"Unsupported parameter type for {k}")
+    return safe_params
 
-    sql = sql_raw.format_map(safe_params)
+def render_template(template_path: str, params: dict) -> str:
+    """Read a template, substitute sanitized params and reject modifying SQL."""
+    # read template, substitute with str.format_map
+    with open(template_path, 'r', encoding='utf8') as f:
+        sql_raw = f.read()
+    sql = sql_raw.format_map(_sanitize_params(params))
     # Safety checks: disallow modification statements
     forbidden = ["insert ", "update ", "delete ", "drop ", "create ", "alter ", "replace "]
     if any(tok in sql.lower() for tok in forbidden):
         raise RuntimeError("Unsafe SQL detected")
-    con = duckdb.connect(DB)
+    return sql
+
+def strip_sql_comments(sql: str) -> str:
+    # drop "-- ..." line comments, leaving quoted strings untouched
+    out, in_str, i = [], False, 0
+    while i < len(sql):
+        ch = sql[i]
+        if ch == "'":
+            in_str = not in_str
+        elif not in_str and sql.startswith("--", i):
+            nl = sql.find("\n", i)
+            i = len(sql) if nl < 0 else nl
+            continue
+        out.append(ch)
+        i += 1
+    return "".join(out)
+
+def split_statements(sql: str) -> list:
+    """Split a multi-statement template into individual statements (comments removed)."""
+    parts, buf, in_str = [], [], False
+    for ch in strip_sql_comments(sql):
+        if ch == "'":
+            in_str = not in_str
+        if ch == ";" and not in_str:
+            parts.append("".join(buf))
+            buf = []
+            continue
+        buf.append(ch)
+    parts.append("".join(buf))
+    return [p.strip() for p in parts if p.strip()]
+
+_pointer_cache = (None, DB)  # (pointer stat, resolved path)
+
+def current_db_path() -> str:
+    """Database file to serve: the version named in DB_POINTER, else DB."""
+    global _pointer_cache
+    try:
+        st = os.stat(DB_POINTER)
+    except OSError:
+        return DB
+    key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    if _pointer_cache[0] != key:
+        # the loader replaces the pointer atomically, so a new inode means a new version
+        with open(DB_POINTER, encoding="utf8") as f:
+            name = f.read().strip()
+        path = os.path.join(os.path.dirname(DB_POINTER), name) if name else DB
+        _pointer_cache = (key, path)
+    return _pointer_cache[1]
+
+def _connect(path: str = None):
+    # the executor only reads, so several processes can share the file;
+    # thread/memory caps keep one heavy query from starving other sessions.
+    # A connection stays on the version it opened, even if the pointer moves mid-query.
+    return duckdb.connect(path or current_db_path(), read_only=True, config={"threads": QUERY_THREADS, "memory_limit": QUERY_MEMORY_LIMIT})
+
+def data_version(path: str = None) -> str:
+    # changes whenever the database file is rebuilt or repointed; part of every cache key
+    path = path or current_db_path()
     try:
-        # We support multi-statement templates; reuse your run_sql_template logic: split and execute sequentially
-        res = con.execute(sql).fetchdf()
-    finally:
-        con.close()
+        st = os.stat(path)
+        return f"{os.path.abspath(path)}:{st.st_mtime_ns}:{st.st_size}"
+    except OSError:
+        return os.path.abspath(path)
+
+def _fetch_arrow(cur):
+    # duckdb >= 1.5 renamed fetch_arrow_table() to to_arrow_table()
+    fetch = getattr(cur, "to_arrow_table", None) or cur.fetch_arrow_table
+    return fetch()
+
+def _fetch_reader(cur, batch_size: int):
+    # duckdb >= 1.5 renamed fetch_record_batch() to to_arrow_reader()
+    fetch = getattr(cur, "to_arrow_reader", None) or cur.fetch_record_batch
+    return fetch(batch_size)
+
+def _register_shared(con, materialize: list, version: str):
+    for name, definition in materialize:
+        table = CTE_CACHE.get_or_compute((version, definition), lambda d=definition: _fetch_arrow(con.execute(d)))
+        con.register(name, table)
+
+def _execute_planned(con, stmts: list, version: str):
+    """Run statements with their shared CTEs computed once (see cte_planner)."""
+    tables = []
+    for stmt, materialize in plan_statements(stmts):
+        _register_shared(con, materialize, version)
+        try:
+            tables.append(_fetch_arrow(con.execute(stmt)))
+        finally:
+            for name, _ in materialize:
+                con.unregister(name)
+    return tables
+
+def _concat_tables(tables):
+    # stack statement results; columns missing from a statement become nulls
+    # (pyarrow is imported on first use to keep module import cheap; duckdb loads it on the first fetch anyway)
+    import pyarrow as pa
+    tables = [t for t in tables if t is not None and t.num_rows > 0]
+    if not tables:
+        return pa.table({})
+    if len(tables) == 1:
+        return tables[0]
+    try:
+        return pa.concat_tables(tables, promote_options="default")
+    except TypeError:  # pyarrow < 14
+        return pa.concat_tables(tables, promote=True)
+
+def run_template_get_arrow(template_path: str, params: dict, priority: str = "interactive", db_path: str = None):
+    """
+    Execute every statement of a template and return (sql, pyarrow.Table).
+    Results of multi-statement templates are stacked; the `metric` column
+    (where the template has one) tells the statements apart.
+    db_path pins a database version (callers that key caches on data_version(db_path)).
+    Raises AdmissionRejected when saturated and QueryTimeout past the template budget.
+    """
+    sql = render_template(template_path, params)
+    path = db_path or current_db_path()
+    with GOVERNOR.admit(priority):
+        con = _connect(path)
+        try:
+            with GOVERNOR.deadline(con, budget_for(template_path)):
+                res = _concat_tables(_execute_planned(con, split_statements(sql), data_version(path)))
+        finally:
+            con.close()
     return sql, res
+
+def run_template_get_results(template_path: str, params: dict, priority: str = "interactive"):
+    """Same as run_template_get_arrow, converted to a pandas DataFrame for callers that need one."""
+    sql, table = run_template_get_arrow(template_path, params, priority)
+    return sql, table.to_pandas()
+
+def stream_template_batches(template_path: str, params: dict, batch_size: int = STREAM_BATCH_ROWS, priority: str = "interactive"):
+    """
+    Return (sql, pyarrow.RecordBatchReader) without fetching the whole result.
+    Single-statement templates (the large district-level ones) stream straight
+    off the DuckDB cursor; multi-statement templates are small aggregates and
+    are stacked first. The query slot and connection are held until the reader
+    is exhausted or garbage-collected, so consume it promptly.
+    """
+    sql = render_template(template_path, params)
+    stmts = split_statements(sql)
+    stack = ExitStack()
+    stack.enter_context(GOVERNOR.admit(priority))
+    try:
+        path = current_db_path()
+        con = _connect(path)
+        stack.callback(con.close)
+        stack.enter_context(GOVERNOR.deadline(con, budget_for(template_path)))
+        if len(stmts) == 1:
+            (stmt, materialize), = plan_statements(stmts)
+            _register_shared(con, materialize, data_version(path))
+            source = _fetch_reader(con.execute(stmt), batch_size)
+            schema = source.schema
+        else:
+            table = _concat_tables(_execute_planned(con, stmts, data_version(path)))
+            schema, source = table.schema, table.to_batches(max_chunksize=batch_size)
+    except BaseException:
+        # unwind with the exception so admit() counts a failure and deadline() can report a timeout
+        if not stack.__exit__(*sys.exc_info()):
+            raise
+
+    def _batches():
+        with stack:
+            yield from source
+
+    import pyarrow as pa
+    gen = _batches()
+    weakref.finalize(gen, stack.close)
+    return sql, pa.RecordBatchReader.from_batches(schema, gen)
+
+def _batched_statement(stmts: list) -> str:
+    # one UNION over all param sets; _batch_row keeps each statement's own ordering
+    parts = [
+        f"SELECT {i} AS _batch_idx, row_number() OVER () AS _batch_row, * FROM ({s}) _q{i}"
+        for i, s in enumerate(stmts)
+    ]
+    return "SELECT * FROM (\n" + "\nUNION ALL BY NAME\n".join(parts) + "\n) ORDER BY _batch_idx, _batch_row"
+
+def run_template_batch(template_path: str, params_list: list, priority: str = "batch"):
+    """
+    Run one template for many param sets, one multi-parameter query per statement.
+    Returns a list aligned with params_list of (sql, pyarrow.Table, error) tuples.
+    """
+    out = [None] * len(params_list)
+    rendered = []  # (position, sql, statements)
+    for i, p in enumerate(params_list):
+        try:
+            sql = render_template(template_path, p)
+            rendered.append((i, sql, split_statements(sql)))
+        except Exception as e:
+            out[i] = (None, None, str(e))
+    if not rendered:
+        return out
+
+    budget = budget_for(template_path)
+    with GOVERNOR.admit(priority):
+        con = _connect()
+        try:
+            for start in range(0, len(rendered), MAX_PARAMS_PER_QUERY):
+                chunk = rendered[start:start + MAX_PARAMS_PER_QUERY]
+                n_stmts = len(chunk[0][2])
+                frames = [[] for _ in chunk]
+                try:
+                    if any(len(c[2]) != n_stmts for c in chunk):
+                        raise RuntimeError("statement count differs between param sets")
+                    # the combined query gets the budget of every param set it answers
+                    with GOVERNOR.deadline(con, budget * len(chunk)):
+                        for s_idx in range(n_stmts):
+                            t = _fetch_arrow(con.execute(_batched_statement([c[2][s_idx] for c in chunk])))
+                            # rows arrive sorted by _batch_idx: hand out zero-copy slices
+                            counts = Counter(t.column("_batch_idx").to_pylist())
+                            t = t.select([c for c in t.column_names if c not in ("_batch_idx", "_batch_row")])
+                            offset = 0
+                            for b_idx in sorted(counts):
+                                frames[b_idx].append(t.slice(offset, counts[b_idx]))
+                                offset += counts[b_idx]
+                    for j, (pos, sql, _) in enumerate(chunk):
+                        out[pos] = (sql, _concat_tables(frames[j]), None)
+                except Exception:
+                    # isolate the failing param set(s) by falling back to one query per set
+                    for pos, sql, stmts in chunk:
+                        try:
+                            with GOVERNOR.deadline(con, budget):
+                                out[pos] = (sql, _concat_tables([_fetch_arrow(con.execute(s)) for s in stmts]), None)
+                        except Exception as e:
+                            out[pos] = (sql, None, str(e))
+        finally:
+            con.close()
+    return out
+
+def extract_sources_from_sql(q: str):
+    # views/tables referenced by the executed SQL (used for citations)
+    identifiers = set()
+    for m in re.finditer(r"\b(?:FROM|JOIN)\s+([a-zA-Z0-9_./]+)", q, re.IGNORECASE):
+        identifiers.add(m.group(1).split(" ")[0].strip())
+    return sorted(identifiers)
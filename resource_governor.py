@@ -0,0 +1,156 @@
+# resource_governor.py
+"""
+Admission control and deadlines for DuckDB work.
+
+ - a bounded admission queue: at most MAX_CONCURRENT_QUERIES run at once,
+   at most MAX_QUEUED_QUERIES wait, interactive requests are admitted before
+   batch ones, and anything beyond that is rejected immediately (an
+   interactive request arriving at a full queue displaces the newest queued
+   batch request instead)
+ - per-template time budgets enforced by interrupting the connection
+ - per-connection `threads` / `memory_limit` caps (see query_executor._connect)
+ - counters for admitted / rejected / timed-out work
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+QUERY_TIMEOUT_S = float(os.getenv("QUERY_TIMEOUT_S", "20"))
+QUERY_THREADS = int(os.getenv("QUERY_THREADS", "2"))
+QUERY_MEMORY_LIMIT = os.getenv("QUERY_MEMORY_LIMIT", "1GB")
+MAX_CONCURRENT_QUERIES = int(os.getenv("MAX_CONCURRENT_QUERIES", "4"))
+MAX_QUEUED_QUERIES = int(os.getenv("MAX_QUEUED_QUERIES", "16"))
+ADMISSION_WAIT_S = float(os.getenv("ADMISSION_WAIT_S", "5"))
+
+# per-template budgets in seconds (template file name -> seconds); others use QUERY_TIMEOUT_S
+TEMPLATE_BUDGETS_S = {
+    "q1_avg_rain_top_crops.sql": 10,
+    "q2_district_high_low.sql": 30,
+    "q3_trend_corr.sql": 10,
+    "q4_policy_args.sql": 10,
+    "q5_district_vs_state_2018.sql": 15,
+    "q6_season_corr.sql": 10,
+    "q7_compare_states.sql": 15,
+}
+# e.g. TEMPLATE_BUDGETS="q2_district_high_low.sql=60,q3_trend_corr.sql=5"
+for _item in filter(None, os.getenv("TEMPLATE_BUDGETS", "").split(",")):
+    _name, _, _secs = _item.partition("=")
+    TEMPLATE_BUDGETS_S[_name.strip()] = float(_secs)
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+class AdmissionRejected(RuntimeError):
+    pass
+
+class QueryTimeout(RuntimeError):
+    pass
+
+def budget_for(template_path: str) -> float:
+    return TEMPLATE_BUDGETS_S.get(os.path.basename(template_path or ""), QUERY_TIMEOUT_S)
+
+class ResourceGovernor:
+    def __init__(self, max_concurrent: int, max_queued: int, wait_s: float):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.wait_s = wait_s
+        self._running = 0
+        self._waiting = []  # heap of (priority, seq)
+        self._displaced = set()  # queued entries rejected to make room for higher-priority work
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self.counters = {"admitted": 0, "rejected": 0, "timeouts": 0, "completed": 0, "failed": 0}
+
+    def _acquire(self, priority: str):
+        prio = PRIORITIES.get(priority, PRIORITIES["batch"])
+        with self._cond:
+            if self._running < self.max_concurrent and not self._waiting:
+                self._running += 1
+                self.counters["admitted"] += 1
+                return
+            if len(self._waiting) >= self.max_queued:
+                worst = max(self._waiting) if self._waiting else None
+                if worst is None or worst[0] <= prio:
+                    self.counters["rejected"] += 1
+                    raise AdmissionRejected(
+                        f"Server busy: {self._running} queries running and {len(self._waiting)} queued. Please retry shortly."
+                    )
+                # the lower-priority waiter gives up its place; it is rejected when it wakes up
+                self._waiting.remove(worst)
+                heapq.heapify(self._waiting)
+                self._displaced.add(worst)
+                self._cond.notify_all()
+            entry = (prio, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            deadline = time.monotonic() + self.wait_s
+            while True:
+                if entry in self._displaced:
+                    self._displaced.discard(entry)
+                    self.counters["rejected"] += 1
+                    raise AdmissionRejected("Server busy: queued request displaced by interactive work. Please retry shortly.")
+                if self._waiting[0] == entry and self._running < self.max_concurrent:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self.counters["rejected"] += 1
+                    self._cond.notify_all()
+                    raise AdmissionRejected(f"Server busy: no query slot freed up within {self.wait_s:g}s. Please retry shortly.")
+                self._cond.wait(remaining)
+            heapq.heappop(self._waiting)
+            self._running += 1
+            self.counters["admitted"] += 1
+            self._cond.notify_all()
+
+    def _release(self):
+        with self._cond:
+            self._running -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, priority: str = "interactive"):
+        """Hold a query slot for the duration of the block (raises AdmissionRejected)."""
+        self._acquire(priority)
+        try:
+            yield
+        except Exception:
+            with self._cond:
+                self.counters["failed"] += 1
+            raise
+        else:
+            with self._cond:
+                self.counters["completed"] += 1
+        finally:
+            self._release()
+
+    @contextmanager
+    def deadline(self, con, seconds: float):
+        """Interrupt `con` if the block runs longer than `seconds` (raises QueryTimeout)."""
+        fired = threading.Event()
+
+        def _interrupt():
+            fired.set()
+            con.interrupt()
+
+        timer = threading.Timer(seconds, _interrupt)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        except Exception as e:
+            if fired.is_set():
+                with self._cond:
+                    self.counters["timeouts"] += 1
+                raise QueryTimeout(f"Query exceeded its {seconds:g}s time budget and was cancelled.") from e
+            raise
+        finally:
+            timer.cancel()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {**self.counters, "running": self._running, "queued": len(self._waiting)}
+
+GOVERNOR = ResourceGovernor(MAX_CONCURRENT_QUERIES, MAX_QUEUED_QUERIES, ADMISSION_WAIT_S)
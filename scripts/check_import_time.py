@@ -0,0 +1,106 @@
+# scripts/check_import_time.py
+"""
+Import-time budget check (CI-style: exits non-zero on any violation).
+
+For each app module it runs `python -X importtime -c "import <module>"` in a
+fresh interpreter, takes the module's cumulative import time (median of
+--runs), and compares it to IMPORT_BUDGETS_MS. It also fails when a module
+drags in a heavy optional dependency at import time (google.genai,
+matplotlib, pandas), and checks streamlit_app.py's top-level imports
+statically since that script cannot be imported without a Streamlit runtime.
+
+Run (from the repo root):
+    python scripts/check_import_time.py [--runs 5] [--scale 1.5]
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# cumulative import budget per module (ms), measured on a warm file cache
+IMPORT_BUDGETS_MS = {
+    "llm_adapter": 150,
+    "nl_parser": 150,
+    "narrative": 30,
+    "prompt_builder": 30,
+    "audit_log": 30,
+    "cte_planner": 50,
+    "resource_governor": 50,
+    "query_executor": 250,
+    "suggest": 350,
+    "session_store": 250,
+}
+# must not be imported as a side effect of importing the app modules
+HEAVY_MODULES = ["google.genai", "matplotlib", "pandas"]
+
+def measure(module: str):
+    code = f"import {module}, sys, json; print(json.dumps(sorted(sys.modules)))"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, capture_output=True, text=True, env={**os.environ, "OFFLINE": "1"},
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    cumulative_us = None
+    for line in proc.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        parts = [p.strip() for p in line[len("import time:"):].split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            cumulative_us = int(parts[1])
+    loaded = json.loads(proc.stdout.strip().splitlines()[-1])
+    return cumulative_us / 1000.0 if cumulative_us is not None else 0.0, loaded
+
+def streamlit_top_level_imports(path: str):
+    tree = ast.parse(open(path, encoding="utf8").read())
+    names = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            names += [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names.append(node.module)
+    return names
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3, help="fresh interpreters per module (median is used)")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget (slow CI machines)")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"{'module':<20}{'median ms':>10}{'budget':>10}")
+    for module, budget in IMPORT_BUDGETS_MS.items():
+        timings, loaded = [], []
+        for _ in range(args.runs):
+            ms, loaded = measure(module)
+            timings.append(ms)
+        median = statistics.median(timings)
+        limit = budget * args.scale
+        status = "ok" if median <= limit else "OVER"
+        print(f"{module:<20}{median:>10.1f}{limit:>10.0f}  {status}")
+        if median > limit:
+            failures.append(f"{module} imports in {median:.1f} ms (budget {limit:.0f} ms)")
+        heavy = [h for h in HEAVY_MODULES if h in loaded]
+        if heavy:
+            failures.append(f"{module} eagerly imports {', '.join(heavy)}")
+
+    app_imports = streamlit_top_level_imports(os.path.join(ROOT, "streamlit_app.py"))
+    heavy = [m for m in app_imports if any(m == h or m.startswith(h + ".") for h in HEAVY_MODULES)]
+    if heavy:
+        failures.append(f"streamlit_app.py imports {', '.join(heavy)} at top level")
+
+    if failures:
+        print("\nImport-time budget FAILED:")
+        for f in failures:
+            print(" -", f)
+        sys.exit(1)
+    print("\nImport-time budget OK")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+# scripts/create_rain_monthly.py
+"""
+Long-format monthly rainfall per subdivision and per state.
+
+Reads:
+  - data/monthly_rainfall_distwise_1901-2017_data.csv (SUBDIVISION, YEAR, JAN..DEC)
+  - diagnostics/subdivision_final_mapping.csv (SUBDIVISION -> MAPPED_STATES)
+
+Writes (compact types: Year int16, Month int8, rainfall_mm float32):
+  - data/rain_subdivision_month.parquet  (Subdivision, Year, Month, rainfall_mm)
+  - data/rain_state_month.parquet        (State, Year, Month, rainfall_mm)
+
+State values are the mean over the subdivisions mapped to the state, as in
+scripts/create_rain_state_year.py. Seasonal/annual rollups are built from
+these files by scripts/load_duckdb_and_views.py.
+"""
+import os
+import pandas as pd
+
+DATA_DIR = "data"
+DIAG_DIR = "diagnostics"
+
+monthly_fp = os.path.join(DATA_DIR, "monthly_rainfall_distwise_1901-2017_data.csv")
+map_fp = os.path.join(DIAG_DIR, "subdivision_final_mapping.csv")
+out_subdiv = os.path.join(DATA_DIR, "rain_subdivision_month.parquet")
+out_state = os.path.join(DATA_DIR, "rain_state_month.parquet")
+
+MONTHS = ["JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC"]
+
+if not os.path.exists(monthly_fp):
+    raise SystemExit(f"Missing {monthly_fp}")
+if not os.path.exists(map_fp):
+    raise SystemExit(f"Missing mapping file: {map_fp}  (run scripts/map_subdivisions.py first)")
+
+print("Loading monthly rainfall and mapping...")
+m = pd.read_csv(monthly_fp, usecols=["SUBDIVISION", "YEAR"] + MONTHS)
+map_df = pd.read_csv(map_fp).fillna("")
+m["SUBDIVISION"] = m["SUBDIVISION"].astype(str).str.strip()
+map_df["SUBDIVISION"] = map_df["SUBDIVISION"].astype(str).str.strip()
+
+# wide -> long; months with no reading are dropped rather than stored as NaN
+long = m.melt(id_vars=["SUBDIVISION", "YEAR"], value_vars=MONTHS, var_name="Month", value_name="rainfall_mm")
+long = long.dropna(subset=["rainfall_mm"])
+long["Month"] = long["Month"].map({name: i + 1 for i, name in enumerate(MONTHS)})
+subdiv = pd.DataFrame({
+    "Subdivision": long["SUBDIVISION"],
+    "Year": long["YEAR"].astype("int16"),
+    "Month": long["Month"].astype("int8"),
+    "rainfall_mm": long["rainfall_mm"].astype("float32"),
+}).sort_values(["Subdivision", "Year", "Month"], ignore_index=True)
+print("Subdivision-month rows:", len(subdiv), "| subdivisions:", subdiv["Subdivision"].nunique())
+
+# one row per (state, subdivision) pair; comma-separated MAPPED_STATES fan out
+pairs = map_df.assign(State=map_df["MAPPED_STATES"].str.split(",")).explode("State")
+pairs["State"] = pairs["State"].astype(str).str.strip()
+pairs = pairs[pairs["State"] != ""][["SUBDIVISION", "State"]].drop_duplicates()
+unmapped = sorted(set(subdiv["Subdivision"]) - set(pairs["SUBDIVISION"]))
+if unmapped:
+    print("Unmapped subdivisions (left out of the state table):", unmapped)
+
+state = subdiv.merge(pairs, left_on="Subdivision", right_on="SUBDIVISION")
+state = state.groupby(["State", "Year", "Month"], as_index=False).agg(rainfall_mm=("rainfall_mm", "mean"))
+state["rainfall_mm"] = state["rainfall_mm"].astype("float32")
+state = state.sort_values(["State", "Year", "Month"], ignore_index=True)
+print("State-month rows:", len(state), "| states:", state["State"].nunique())
+print("Year range:", state["Year"].min(), "-", state["Year"].max())
+
+subdiv.to_parquet(out_subdiv, index=False)
+state.to_parquet(out_state, index=False)
+print("Wrote", out_subdiv, "and", out_state)
+print("Re-run scripts/load_duckdb_and_views.py to rebuild the seasonal rollup tables.")
@@ -1,57 +1,245 @@
 # scripts/load_duckdb_and_views.py
 """
-Load canonical parquet files into a DuckDB file and create helpful views.
+Load canonical parquet files into a new, versioned DuckDB file and switch readers to it.
+
+Blue/green rebuild: the serving database is never opened for writing.
+ 1. build data/agri_climate.<timestamp>.duckdb from the parquet/csv inputs
+    (name and directory follow DUCKDB_PATH / DUCKDB_POINTER, as in query_executor)
+ 2. validate it (row counts and sanity queries); on failure it is deleted
+    and the current version keeps serving
+ 3. atomically repoint data/agri_climate.current at the new file; readers
+    (query_executor) pick it up on their next request
+ 4. delete versions older than the newest KEEP_DB_VERSIONS
+
 Run:
     python scripts/load_duckdb_and_views.py
 Outputs:
- - data/agri_climate.duckdb
- - duckdb contains views: state_year_rain, crop_state_year, district_year_crop (if season_crop_clean exists)
+ - data/agri_climate.<timestamp>.duckdb and the data/agri_climate.current pointer
+ - duckdb contains tables: state_year_rain, crop_state_year, season_crop_clean and view district_year_crop (if season_crop_clean exists)
+ - monthly rainfall tables rain_subdivision_month / rain_state_month and their seasonal
+   rollups subdivision_season_rain / state_season_rain (if scripts/create_rain_monthly.py was run)
+ - warmed answer caches under cache/ (set WARM_AFTER_LOAD=0 to skip)
 """
+import glob
 import os
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
 import duckdb
+from dotenv import load_dotenv
 
+load_dotenv()
 DATA_DIR = "data"
-DB_PATH = os.path.join(DATA_DIR, "agri_climate.duckdb")
+# same settings as query_executor, so the loader writes what the readers serve
+DB_PATH = os.getenv("DUCKDB_PATH", os.path.join(DATA_DIR, "agri_climate.duckdb"))  # legacy single-file database
+DB_POINTER = os.getenv("DUCKDB_POINTER", os.path.splitext(DB_PATH)[0] + ".current")
+DB_DIR = os.path.dirname(DB_POINTER)  # readers resolve the pointer's file name here
+DB_STEM = os.path.splitext(os.path.basename(DB_PATH))[0]
 PAR_RAIN = os.path.join(DATA_DIR, "rain_state_year.parquet")
 PAR_CROP = os.path.join(DATA_DIR, "crop_state_year.parquet")
 SEASON_CLEAN = os.path.join(DATA_DIR, "season_crop_clean.csv")  # optional: district-level
+PAR_RAIN_SUBDIV_MONTH = os.path.join(DATA_DIR, "rain_subdivision_month.parquet")  # optional: monthly
+PAR_RAIN_STATE_MONTH = os.path.join(DATA_DIR, "rain_state_month.parquet")
+KEEP_DB_VERSIONS = int(os.getenv("KEEP_DB_VERSIONS", "2"))
+
+def _sql_path(p):
+    return p.replace("\\", "/")
+
+# season -> [(month, year_shift)]. For every season except "annual", Year is the agricultural
+# year Jun Year .. May Year+1 (the crop tables' convention), so January-May count towards the
+# previous Year: rabi of Year runs Oct Year .. Mar Year+1, winter and pre-monsoon fall in Year+1.
+# "annual" is the calendar year, matching state_year_rain.
+SEASONS = {
+    "winter": [(1, -1), (2, -1)],
+    "pre_monsoon": [(3, -1), (4, -1), (5, -1)],
+    "monsoon": [(6, 0), (7, 0), (8, 0), (9, 0)],
+    "post_monsoon": [(10, 0), (11, 0), (12, 0)],
+    "kharif": [(6, 0), (7, 0), (8, 0), (9, 0), (10, 0)],
+    "rabi": [(10, 0), (11, 0), (12, 0), (1, -1), (2, -1), (3, -1)],
+    "annual": [(m, 0) for m in range(1, 13)],
+}
+
+def _season_rollup_sql(table, month_table, key):
+    # one row per (key, Season, Year) with every month of the season present;
+    # sorted so WHERE key = ... AND Season = ... prunes row groups via zonemaps
+    values = ", ".join(f"('{s}', {m}, {shift}, {len(months)})" for s, months in SEASONS.items() for m, shift in months)
+    return f"""
+        CREATE TABLE {table} AS
+        WITH seasons(Season, Month, year_shift, n_months) AS (VALUES {values})
+        SELECT m.{key}, s.Season, (m.Year + s.year_shift)::SMALLINT AS Year, SUM(m.rainfall_mm)::FLOAT AS rainfall_mm
+        FROM {month_table} m JOIN seasons s ON m.Month = s.Month
+        GROUP BY m.{key}, s.Season, m.Year + s.year_shift
+        HAVING COUNT(*) = ANY_VALUE(s.n_months)
+        ORDER BY m.{key}, s.Season, Year;
+    """
+
+def current_version_path():
+    if os.path.exists(DB_POINTER):
+        with open(DB_POINTER, encoding="utf8") as f:
+            name = f.read().strip()
+        if name:
+            return os.path.join(DB_DIR, name)
+    return DB_PATH if os.path.exists(DB_PATH) else None
+
+def build(new_path):
+    con = duckdb.connect(new_path)
+    print("Building", new_path)
+    try:
+        # tables (not views over parquet) so each version is self-contained
+        if os.path.exists(PAR_RAIN):
+            con.execute(f"CREATE TABLE state_year_rain AS SELECT State, Year::INTEGER AS Year, annual_rainfall_mm FROM read_parquet('{_sql_path(PAR_RAIN)}') ORDER BY State, Year;")
+            print("Created table: state_year_rain")
+        else:
+            print("Missing:", PAR_RAIN)
+
+        if os.path.exists(PAR_CROP):
+            con.execute(f"CREATE TABLE crop_state_year AS SELECT State, Year::INTEGER AS Year, Crop, Area_ha, Production_tonnes FROM read_parquet('{_sql_path(PAR_CROP)}') ORDER BY State, Year;")
+            print("Created table: crop_state_year")
+        else:
+            print("Missing:", PAR_CROP)
+
+        # monthly rainfall and its seasonal rollups
+        for par, month_table, rollup, key in (
+            (PAR_RAIN_SUBDIV_MONTH, "rain_subdivision_month", "subdivision_season_rain", "Subdivision"),
+            (PAR_RAIN_STATE_MONTH, "rain_state_month", "state_season_rain", "State"),
+        ):
+            if not os.path.exists(par):
+                print("Missing:", par, "(run scripts/create_rain_monthly.py); skipping", rollup)
+                continue
+            con.execute(f"""
+                CREATE TABLE {month_table} AS
+                SELECT {key}, Year::SMALLINT AS Year, Month::TINYINT AS Month, rainfall_mm::FLOAT AS rainfall_mm
+                FROM read_parquet('{_sql_path(par)}') ORDER BY {key}, Year, Month;
+            """)
+            con.execute(_season_rollup_sql(rollup, month_table, key))
+            print(f"Created tables: {month_table}, {rollup}")
+
+        # If you have the cleaned season_crop file, make a district-level aggregate view as well
+        prev = current_version_path()
+        if os.path.exists(SEASON_CLEAN):
+            # create a table from csv and aggregate district-year-crop
+            con.execute("CREATE TABLE season_crop_clean AS SELECT * FROM read_csv_auto('{}');".format(_sql_path(SEASON_CLEAN)))
+        elif prev:
+            # carry the district-level table over from the version being replaced
+            con.execute(f"ATTACH '{_sql_path(prev)}' AS prev (READ_ONLY);")
+            has = con.execute("SELECT count(*) FROM duckdb_tables() WHERE database_name = 'prev' AND table_name = 'season_crop_clean'").fetchone()[0]
+            if has:
+                con.execute("CREATE TABLE season_crop_clean AS SELECT * FROM prev.season_crop_clean;")
+                print("Copied table season_crop_clean from", prev)
+            con.execute("DETACH prev;")
+        if con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'season_crop_clean'").fetchone()[0]:
+            con.execute("""
+                CREATE VIEW district_year_crop AS
+                SELECT State, District, Year::INTEGER AS Year, Crop, sum(Area) as Area_ha, sum(Production) as Production_tonnes
+                FROM season_crop_clean
+                GROUP BY State, District, Year, Crop;
+            """)
+            print("Created view: district_year_crop (from season_crop_clean)")
+        else:
+            print("season_crop_clean.csv not found; skipping district view creation.")
+        con.execute("CHECKPOINT;")
+    finally:
+        con.close()
+
+# (description, sql returning one row of values, check on that row)
+SANITY_CHECKS = [
+    ("rainfall rows", "SELECT COUNT(*) FROM state_year_rain", lambda r: r[0] > 0),
+    ("rainfall years in range", "SELECT MIN(Year), MAX(Year) FROM state_year_rain", lambda r: 1800 <= r[0] <= r[1] <= 2100),
+    ("rainfall has no null states or negative totals",
+     "SELECT COUNT(*) FROM state_year_rain WHERE State IS NULL OR annual_rainfall_mm < 0", lambda r: r[0] == 0),
+    ("crop rows", "SELECT COUNT(*) FROM crop_state_year", lambda r: r[0] > 0),
+    ("crop years in range", "SELECT MIN(Year), MAX(Year) FROM crop_state_year", lambda r: 1800 <= r[0] <= r[1] <= 2100),
+    ("crop and rainfall years overlap",
+     "SELECT COUNT(DISTINCT c.Year) FROM crop_state_year c JOIN state_year_rain r ON r.State = c.State AND r.Year = c.Year",
+     lambda r: r[0] > 0),
+]
+
+def validate(new_path):
+    con = duckdb.connect(new_path, read_only=True)
+    problems = []
+    try:
+        for desc, sql, check in SANITY_CHECKS:
+            try:
+                row = con.execute(sql).fetchone()
+                ok = check(row)
+            except Exception as e:
+                row, ok = str(e), False
+            print(f"  [{'ok' if ok else 'FAIL'}] {desc}: {row}")
+            if not ok:
+                problems.append(desc)
+        has_district = con.execute("SELECT count(*) FROM duckdb_views() WHERE view_name = 'district_year_crop'").fetchone()[0]
+        if has_district:
+            n = con.execute("SELECT COUNT(*) FROM district_year_crop").fetchone()[0]
+            print(f"  [{'ok' if n else 'FAIL'}] district rows: {n}")
+            if not n:
+                problems.append("district rows")
+        has_seasons = con.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = 'state_season_rain'").fetchone()[0]
+        if has_seasons:
+            # seasons inside calendar year Year (Jun-Dec) are part of that year's annual total
+            bad = con.execute("""
+                SELECT COUNT(*) FROM state_season_rain s JOIN state_season_rain a
+                  ON a.State = s.State AND a.Year = s.Year AND a.Season = 'annual'
+                WHERE s.Season IN ('monsoon', 'post_monsoon', 'kharif')
+                  AND s.rainfall_mm > a.rainfall_mm + 0.5
+            """).fetchone()[0]
+            n = con.execute("SELECT COUNT(*) FROM state_season_rain").fetchone()[0]
+            ok = n > 0 and bad == 0
+            print(f"  [{'ok' if ok else 'FAIL'}] seasonal rollups: {n} rows, {bad} above the annual total")
+            if not ok:
+                problems.append("seasonal rollups")
+    finally:
+        con.close()
+    return problems
+
+def switch_pointer(new_path):
+    tmp = DB_POINTER + ".tmp"
+    with open(tmp, "w", encoding="utf8") as f:
+        f.write(os.path.basename(new_path) + "\n")
+    os.replace(tmp, DB_POINTER)  # atomic: readers see either the old or the new name
+
+def collect_garbage(keep):
+    versions = sorted(glob.glob(os.path.join(glob.escape(DB_DIR), glob.escape(DB_STEM) + ".*.duckdb")))
+    current = current_version_path()
+    old = [v for v in versions[:-keep] if os.path.abspath(v) != os.path.abspath(current or "")] if keep > 0 else []
+    for v in old:
+        for p in (v, v + ".wal"):
+            try:
+                if os.path.exists(p):
+                    os.remove(p)
+            except OSError as e:
+                # still open by a reader (e.g. on Windows); retried on the next load
+                print("Could not remove", p, "-", e)
+    return old
+
+if __name__ == "__main__":
+    new_path = os.path.join(DB_DIR, f"{DB_STEM}.{datetime.now(timezone.utc):%Y%m%dT%H%M%S}.duckdb")
+    if os.path.exists(new_path):
+        # never write into a version that may already be serving
+        raise SystemExit(f"{new_path} already exists; retry in a second")
+    t0 = time.perf_counter()
+    try:
+        build(new_path)
+    except Exception:
+        if os.path.exists(new_path):
+            os.remove(new_path)
+        raise
+
+    print("Validating", new_path)
+    problems = validate(new_path)
+    if problems:
+        os.remove(new_path)
+        raise SystemExit(f"Validation failed ({', '.join(problems)}); keeping {current_version_path()}")
+
+    previous = current_version_path()
+    switch_pointer(new_path)
+    print(f"Switched {DB_POINTER}: {previous} -> {new_path}")
+    removed = collect_garbage(KEEP_DB_VERSIONS)
+    if removed:
+        print("Removed old versions:", ", ".join(removed))
+    print(f"DuckDB setup complete in {time.perf_counter() - t0:.1f}s.")
 
-con = duckdb.connect(DB_PATH)
-print("Connected to", DB_PATH)
-
-# register parquet files as views/tables
-if os.path.exists(PAR_RAIN):
-    con.execute(f"CREATE OR REPLACE VIEW state_year_rain AS SELECT State, Year::INTEGER AS Year, annual_rainfall_mm FROM read_parquet('{PAR_RAIN}');")
-    print("Created view: state_year_rain")
-else:
-    print("Missing:", PAR_RAIN)
-
-if os.path.exists(PAR_CROP):
-    con.execute(f"CREATE OR REPLACE VIEW crop_state_year AS SELECT State, Year::INTEGER AS Year, Crop, Area_ha, Production_tonnes FROM read_parquet('{PAR_CROP}');")
-    print("Created view: crop_state_year")
-else:
-    print("Missing:", PAR_CROP)
-
-# If you have the cleaned season_crop file, make a district-level aggregate view as well
-if os.path.exists(SEASON_CLEAN):
-    # create a table from csv and aggregate district-year-crop
-    con.execute("CREATE OR REPLACE TABLE season_crop_clean AS SELECT * FROM read_csv_auto('{}');".format(SEASON_CLEAN.replace("\\","/")))
-    con.execute("""
-        CREATE OR REPLACE VIEW district_year_crop AS
-        SELECT State, District, Year::INTEGER AS Year, Crop, sum(Area) as Area_ha, sum(Production) as Production_tonnes
-        FROM season_crop_clean
-        GROUP BY State, District, Year, Crop;
-    """)
-    print("Created view: district_year_crop (from season_crop_clean)")
-else:
-    print("season_crop_clean.csv not found; skipping district view creation.")
-
-# simple sanity queries
-print("Sample years in rainfall:")
-print(con.execute("SELECT MIN(Year), MAX(Year), COUNT(*) FROM state_year_rain").fetchall())
-if os.path.exists(PAR_CROP):
-    print("Sample years in crops:")
-    print(con.execute("SELECT MIN(Year), MAX(Year), COUNT(*) FROM crop_state_year").fetchall())
-
-con.close()
-print("DuckDB setup complete.")
+    # pre-compute the most frequent answers against the new data (see cache_warmer.py)
+    if os.getenv("WARM_AFTER_LOAD", "1") == "1":
+        print("Warming answer caches...")
+        subprocess.run([sys.executable, "cache_warmer.py"], check=False)
@@ -0,0 +1,242 @@
+# session_store.py
+"""
+Session-scoped result reuse for follow-up questions.
+
+Each session gets a private in-memory DuckDB connection on which its recent
+results are registered (zero-copy) as Arrow views r1, r2, ... plus `last`.
+Follow-ups such as "now just wheat", "only Punjab", "top 2" or "last 5 years"
+are answered by SQL over those views instead of the base tables. Follow-ups
+that need more data than the previous result holds ("extend to 15 years",
+"what about Kerala") re-run the previous template with the changed params,
+skipping the parse.
+
+Memory is bounded per session (SESSION_MAX_MB, SESSION_MAX_RESULTS, oldest
+result evicted first) and across sessions (MAX_SESSIONS). Sessions are closed
+when their owner calls end(), when the handle from open() is garbage
+collected (Streamlit drops session_state when a browser session ends), or
+after SESSION_TTL_S idle seconds.
+"""
+import os
+import re
+import threading
+import time
+import uuid
+import weakref
+from collections import OrderedDict
+
+import duckdb
+
+from query_executor import _fetch_arrow
+
+SESSION_MAX_MB = float(os.getenv("SESSION_MAX_MB", "32"))
+SESSION_MAX_RESULTS = int(os.getenv("SESSION_MAX_RESULTS", "8"))
+SESSION_TTL_S = float(os.getenv("SESSION_TTL_S", "1800"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "200"))
+
+# a follow-up is short and refers back to the previous answer
+FOLLOW_UP_WORDS = re.compile(r"\b(now|just|only|instead|extend|expand|narrow|limit|same|what about|how about|and for)\b", re.I)
+FOLLOW_UP_MAX_WORDS = 12
+CROP_WORDS = re.compile(r"\b(rice|wheat|maize|bajra|jowar|ragi)\b", re.I)
+
+def _quote_list(values):
+    return ", ".join("'" + str(v).replace("'", "''") + "'" for v in values)
+
+class _Session:
+    def __init__(self):
+        self.con = duckdb.connect(":memory:", config={"threads": 1})
+        self.results = OrderedDict()  # view name -> entry dict
+        self.nbytes = 0
+        self.counter = 0
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.results.clear()
+        self.con.close()
+
+class SessionHandle:
+    """Keep in the per-session state; the session's results are freed with it."""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+
+class SessionStore:
+    def __init__(self, max_bytes=int(SESSION_MAX_MB * 1024 * 1024), max_results=SESSION_MAX_RESULTS,
+                 ttl_s=SESSION_TTL_S, max_sessions=MAX_SESSIONS):
+        self.max_bytes = max_bytes
+        self.max_results = max_results
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session id -> _Session, least recently used first
+        self._lock = threading.Lock()
+
+    def open(self, session_id: str = None) -> SessionHandle:
+        handle = SessionHandle(session_id or uuid.uuid4().hex)
+        weakref.finalize(handle, self.end, handle.session_id)
+        return handle
+
+    def _get(self, session_id: str, create: bool = False):
+        with self._lock:
+            s = self._sessions.get(session_id)
+            if s is None and create:
+                s = self._sessions[session_id] = _Session()
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)[1].close()
+            if s is not None:
+                self._sessions.move_to_end(session_id)
+                s.last_used = time.monotonic()
+            return s
+
+    def end(self, session_id: str):
+        with self._lock:
+            s = self._sessions.pop(session_id, None)
+        if s is not None:
+            with s.lock:
+                s.close()
+
+    def sweep(self):
+        """Close sessions idle for longer than the TTL; returns how many were closed."""
+        cutoff = time.monotonic() - self.ttl_s
+        with self._lock:
+            idle = [sid for sid, s in self._sessions.items() if s.last_used < cutoff]
+            closed = [self._sessions.pop(sid) for sid in idle]
+        for s in closed:
+            with s.lock:
+                s.close()
+        return len(closed)
+
+    def remember(self, session_id: str, question: str, template: str, params: dict, sql: str, table, crops=None) -> str:
+        """Register a result for the session; returns its view name. `crops` is the crop narrowing applied to it."""
+        self.sweep()
+        s = self._get(session_id, create=True)
+        with s.lock:
+            s.counter += 1
+            name = f"r{s.counter}"
+            s.con.register(name, table)
+            s.con.register("last", table)
+            s.results[name] = {"question": question, "template": template, "params": dict(params or {}),
+                               "sql": sql, "table": table, "nbytes": table.nbytes, "crops": list(crops or [])}
+            s.nbytes += table.nbytes
+            # oldest results go first; the newest one always stays, even when it alone is over budget
+            while len(s.results) > 1 and (s.nbytes > self.max_bytes or len(s.results) > self.max_results):
+                old, entry = s.results.popitem(last=False)
+                s.con.unregister(old)
+                s.nbytes -= entry["nbytes"]
+        return name
+
+    def last(self, session_id: str):
+        s = self._get(session_id)
+        if s is None or not s.results:
+            return None
+        return next(reversed(s.results.values()))
+
+    def stats(self, session_id: str = None) -> dict:
+        with self._lock:
+            sessions = list(self._sessions.items())
+        out = {"sessions": len(sessions), "bytes": sum(s.nbytes for _, s in sessions)}
+        if session_id is not None:
+            s = dict(sessions).get(session_id)
+            out["session_results"] = list(s.results) if s else []
+            out["session_bytes"] = s.nbytes if s else 0
+        return out
+
+    def follow_up(self, session_id: str, question: str, run=None):
+        """
+        Answer `question` as a refinement of the session's last result, or
+        return None when it does not look like one. Returns a dict with
+        template, params, sql (the base-table SQL, for citations), table,
+        derived_sql (SQL run over the session views, or None), reran
+        (True when the template had to be executed again) and crops (the crop
+        narrowing in effect; pass it on to remember()).
+        `run(template, params) -> (sql, table)` defaults to answer_cache.cached_results.
+        """
+        prev = self.last(session_id)
+        if prev is None or not question or len(question.split()) > FOLLOW_UP_MAX_WORDS:
+            return None
+        text = question.strip()
+        cols = set(prev["table"].column_names)
+        params = dict(prev["params"])
+        filters, qualify, rerun = [], None, {}
+
+        m = re.search(r"(\d+)\s*years?", text, re.I)
+        if m and "N_YEARS" in params:
+            n = int(m.group(1))
+            if "Year" in cols and n <= int(params["N_YEARS"]):
+                filters.append(f"Year IN (SELECT DISTINCT Year FROM last ORDER BY Year DESC LIMIT {n})")
+                params["N_YEARS"] = n
+            elif n != int(params["N_YEARS"]):
+                rerun["N_YEARS"] = n
+
+        m = re.search(r"top\s*(\d+)", text, re.I)
+        if m and "TOP_M" in params:
+            k = int(m.group(1))
+            if {"State", "total_prod_tonnes"} <= cols and k <= int(params["TOP_M"]):
+                # re-rank the previous top crops; other metric rows pass through
+                keep_other = "metric IS DISTINCT FROM 'top_crops' OR " if "metric" in cols else ""
+                qualify = f"{keep_other}row_number() OVER (PARTITION BY State ORDER BY total_prod_tonnes DESC NULLS LAST) <= {k}"
+                params["TOP_M"] = k
+            elif k != int(params["TOP_M"]):
+                rerun["TOP_M"] = k
+
+        from nl_parser import extract_states
+        states = extract_states(text)
+        if states:
+            present = set(prev["table"].column("State").to_pylist()) if "State" in cols else set()
+            if present and set(states) <= present:
+                filters.append(f"State IN ({_quote_list(states)})")
+                if "STATES" in params:
+                    params["STATES"] = sorted(states)
+            elif "STATES" in params:
+                rerun["STATES"] = sorted(set(states) | (set(params["STATES"]) if re.search(r"\b(add|also|and for)\b", text, re.I) else set()))
+            elif "STATE" in params and len(states) == 1:
+                rerun["STATE"] = states[0]
+            else:
+                # states the previous template cannot take (e.g. q1's STATE_A/STATE_B): parse afresh
+                return None
+
+        crops = []
+        if "Crop" in cols:
+            known = {str(c) for c in prev["table"].column("Crop").to_pylist() if c}
+            crops = [c for c in sorted(known) if re.search(rf"\b{re.escape(c.lower())}\b", text.lower())]
+        if crops:
+            filters.append(f"(Crop IS NULL OR Crop IN ({_quote_list(crops)}))")
+        else:
+            named = CROP_WORDS.findall(text)
+            for key in ("CROP_NAME", "CROP"):
+                if named and key in params:
+                    rerun[key] = named[0].title()
+
+        if not (filters or qualify or rerun):
+            return None
+        if not (FOLLOW_UP_WORDS.search(text) or len(text.split()) <= 4):
+            return None
+
+        template, sql, table, reran = prev["template"], prev["sql"], prev["table"], False
+        if rerun:
+            if run is None:
+                from answer_cache import cached_results as run
+            params.update(rerun)
+            sql, table = run(template, params)
+            reran = True
+            # the re-run starts from the base tables; narrow it to the crops picked earlier in the session
+            if not crops and prev["crops"] and "Crop" in table.column_names and not {"CROP_NAME", "CROP"} & set(rerun):
+                crops = prev["crops"]
+                filters.append(f"(Crop IS NULL OR Crop IN ({_quote_list(crops)}))")
+        derived_sql = None
+        if filters or qualify:
+            import pyarrow as pa
+            s = self._get(session_id)
+            if s is None:
+                return None  # session ended or was evicted meanwhile
+            with s.lock:
+                # number the rows so the derived result keeps the previous result's order
+                s.con.register("last", table.append_column("_row", pa.array(range(table.num_rows), pa.int64())))
+                derived_sql = ("SELECT * EXCLUDE (_row) FROM last" + (" WHERE " + " AND ".join(filters) if filters else "")
+                               + (f" QUALIFY {qualify}" if qualify else "") + " ORDER BY _row")
+                table = _fetch_arrow(s.con.execute(derived_sql))
+        if not crops and not {"CROP_NAME", "CROP"} & set(rerun):
+            crops = prev["crops"]
+        return {"template": template, "params": params, "sql": sql, "table": table,
+                "derived_sql": derived_sql, "reran": reran, "crops": crops}
+
+SESSIONS = SessionStore()
@@ -0,0 +1,32 @@
+-- q6_season_corr.sql
+-- Params: {STATE}, {CROP_NAME}, {SEASON}, {N_YEARS}
+-- {SEASON} is one of winter, pre_monsoon, monsoon, post_monsoon, kharif, rabi, annual.
+-- For every season but annual, state_season_rain.Year is the agricultural year Jun Year .. May Year+1
+-- (rabi of Year = Oct Year .. Mar Year+1), the same convention as crop_state_year.Year, so the
+-- two series line up on Year. annual is the calendar year, as in state_year_rain.
+
+-- last N years common to both series in this state
+WITH prod_years AS (
+  SELECT Year FROM crop_state_year WHERE State = '{STATE}' AND LOWER(Crop) LIKE LOWER('%{CROP_NAME}%')
+),
+rain_years AS (
+  SELECT Year FROM state_season_rain WHERE State = '{STATE}' AND Season = '{SEASON}'
+),
+common_years AS (
+  SELECT Year FROM prod_years INTERSECT SELECT Year FROM rain_years ORDER BY Year DESC LIMIT {N_YEARS}
+),
+prod_ts AS (
+  SELECT Year, SUM(Production_tonnes) AS production
+  FROM crop_state_year
+  WHERE State = '{STATE}' AND LOWER(Crop) LIKE LOWER('%{CROP_NAME}%') AND Year IN (SELECT Year FROM common_years)
+  GROUP BY Year
+),
+rain_ts AS (
+  SELECT Year, ROUND(rainfall_mm::DOUBLE, 1) AS rainfall
+  FROM state_season_rain
+  WHERE State = '{STATE}' AND Season = '{SEASON}' AND Year IN (SELECT Year FROM common_years)
+)
+-- aligned time-series: production against the season's rainfall
+SELECT p.Year, p.production, r.rainfall, '{SEASON}' AS season
+FROM prod_ts p JOIN rain_ts r ON p.Year = r.Year
+ORDER BY p.Year;
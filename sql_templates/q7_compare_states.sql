@@ -0,0 +1,40 @@
+-- q7_compare_states.sql
+-- Params: {STATES}, {N_YEARS}, {TOP_M}, {CEREAL_WHERE}
+-- {STATES} is a list param, rendered as 'Punjab','Haryana',...
+-- N-state version of q1_avg_rain_top_crops.sql in one statement: a single scan per table
+-- with State IN (...), common years = years present for every requested state that has
+-- rainfall data (states without any are reported by the narrative), and per-state ranking.
+-- At most len(STATES) * (1 + TOP_M) rows come back.
+
+WITH rain AS (
+  SELECT State, Year, annual_rainfall_mm FROM state_year_rain WHERE State IN ({STATES})
+),
+common_years AS (
+  SELECT Year FROM rain
+  GROUP BY Year
+  HAVING COUNT(DISTINCT State) = (SELECT COUNT(DISTINCT State) FROM rain)
+  ORDER BY Year DESC
+  LIMIT {N_YEARS}
+),
+rain_avg AS (
+  SELECT r.State, AVG(r.annual_rainfall_mm) AS avg_rain_mm, COUNT(DISTINCT r.Year) AS years_count
+  FROM rain r JOIN common_years y ON r.Year = y.Year
+  GROUP BY r.State
+),
+crop_tot AS (
+  SELECT c.State, c.Crop, SUM(c.Production_tonnes) AS total_prod_tonnes
+  FROM crop_state_year c JOIN common_years y ON c.Year = y.Year
+  WHERE c.State IN ({STATES})
+  {CEREAL_WHERE}
+  GROUP BY c.State, c.Crop
+),
+ranked AS (
+  SELECT ct.*, ROW_NUMBER() OVER (PARTITION BY ct.State ORDER BY ct.total_prod_tonnes DESC) AS rn
+  FROM crop_tot ct
+)
+SELECT * FROM (
+  SELECT 'rainfall' AS metric, State, avg_rain_mm, years_count FROM rain_avg
+  UNION ALL BY NAME
+  SELECT 'top_crops' AS metric, State, Crop, total_prod_tonnes, rn AS crop_rank FROM ranked WHERE rn <= {TOP_M}
+)
+ORDER BY metric, State, crop_rank;
@@ -1,97 +1,160 @@
 # streamlit_app.py
 import streamlit as st
-from nl_parser import parse
-from query_executor import run_template_get_results
+from query_executor import extract_sources_from_sql, data_version
 from llm_adapter import llm_generate_short
-import pandas as pd
-import matplotlib.pyplot as plt
-import os, re, csv, json, hashlib
+from answer_cache import cached_parse, cached_results_with_version, cached_narrative
+from prompt_builder import build_narrative_prompt
+from narrative import compose_narrative
+from audit_log import append_audit
+from resource_governor import GOVERNOR
+from suggest import suggest
+from session_store import SESSIONS
+import pyarrow as pa
+import os, json, hashlib
 from datetime import datetime
 
 st.set_page_config(page_title="Agri-Climate Q&A", layout="wide")
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def chart_series(sql_hash: str, version: str, _table):
+    # first numeric column vs Year, cached per executed SQL and data version so reruns skip the conversion
+    ycol = [f.name for f in _table.schema if f.name.lower() not in ('state','crop','metric','year') and (pa.types.is_floating(f.type) or pa.types.is_integer(f.type))]
+    if not ycol:
+        return None, None
+    return {"Year": _table.column('Year').to_pylist(), ycol[0]: _table.column(ycol[0]).to_pylist()}, ycol[0]
+
+@st.cache_resource(show_spinner=False)
+def _warm_caches_on_start():
+    # once per server process, in the background so the first page load is not delayed
+    import threading
+    from cache_warmer import warm
+    t = threading.Thread(target=warm, name="cache-warmer", daemon=True)
+    t.start()
+    return t
+
+if os.getenv("WARM_ON_START", "1") == "1":
+    _warm_caches_on_start()
 st.title("Agri-Climate Q&A — Punjab, Rajasthan, and all India datasets")
 
 st.markdown("""Ask natural-language questions about rainfall and crop production.""")
 
 question = st.text_input("Type your question here", value="Compare the average annual rainfall in Punjab and Rajasthan for the last 10 years and list the top 3 cereals in each state.")
+try:
+    hints = suggest(question, limit=6)
+except Exception:
+    # suggestions are optional; a broken index or missing DB must not stop the page
+    hints = []
+if hints:
+    st.caption("Suggestions: " + " · ".join(h["value"] for h in hints))
 offline = st.checkbox("Offline mode (no external LLM calls)", value=os.getenv("OFFLINE", "0") == "1")
 os.environ["OFFLINE"] = "1" if offline else "0"
+polish = st.checkbox("Polish the answer with the LLM", value=False, disabled=offline)
+with st.sidebar.expander("Query governor"):
+    st.json(GOVERNOR.snapshot())
+# per-browser-session results for follow-ups; freed when Streamlit drops the session state
+if "session" not in st.session_state:
+    st.session_state["session"] = SESSIONS.open()
+session_id = st.session_state["session"].session_id
+with st.sidebar.expander("Session results"):
+    st.json(SESSIONS.stats(session_id))
 
 if st.button("Ask"):
     if not question.strip():
         st.warning("Please enter a question.")
     else:
-        st.info("Parsing question...")
-        parsed = parse(question)
-        template = parsed.get("template")
-        params = parsed.get("params",{})
-        st.write("**Parsed template**:", template)
-        st.write("**Parameters**:", params)
-
-        st.info("Executing SQL...")
+        # data version the table was read from, so its narrative is cached under the same one
+        read_version = {}
+
+        def run(template, params):
+            sql, table, read_version["v"] = cached_results_with_version(template, params)
+            return sql, table
+
+        # follow-ups ("now just wheat", "extend to 15 years") reuse this session's previous result
         try:
-            sql, df = run_template_get_results(template, params)
+            follow = SESSIONS.follow_up(session_id, question, run=run)
         except Exception as e:
-            st.error(f"SQL execution failed: {e}")
-            st.stop()
+            st.write("Follow-up reuse skipped:", e)
+            follow = None
+        if follow:
+            template, params = follow["template"], follow["params"]
+            sql, table = follow["sql"], follow["table"]
+            st.info("Re-ran the previous question with new parameters." if follow["reran"] else "Answered from the previous result in this session.")
+            st.write("**Template**:", template)
+            st.write("**Parameters**:", params)
+        else:
+            st.info("Parsing question...")
+            parsed = cached_parse(question)
+            template = parsed.get("template")
+            params = parsed.get("params",{})
+            st.write("**Parsed template**:", template)
+            st.write("**Parameters**:", params)
 
+            st.info("Executing SQL...")
+            try:
+                sql, table = run(template, params)
+            except Exception as e:
+                st.error(f"SQL execution failed: {e}")
+                st.stop()
+        SESSIONS.remember(session_id, question, template, params, sql, table, crops=(follow or {}).get("crops"))
+
+        sql_hash = hashlib.sha256(sql.encode("utf-8")).hexdigest()
+        # session follow-ups can narrow the result of the same SQL, so key the chart on both
+        derived_sql = (follow or {}).get("derived_sql") or ""
+        result_key = hashlib.sha256((sql + derived_sql).encode("utf-8")).hexdigest() if derived_sql else sql_hash
         st.subheader("Executed SQL")
         with st.expander("Show SQL"):
             st.code(sql, language="sql")
+            if derived_sql:
+                st.caption("Applied to that result within this session:")
+                st.code(derived_sql, language="sql")
 
         st.subheader("Results")
-        if df is None or df.empty:
+        if table is None or table.num_rows == 0:
             st.write("No results returned.")
         else:
-            st.dataframe(df)
+            # Arrow tables render directly, no pandas copy
+            st.dataframe(table)
 
             # quick plot if numeric time-series (Year present)
-            if 'Year' in df.columns and ('production' in "".join(df.columns).lower() or 'prod' in "".join(df.columns).lower() or 'rain' in "".join(df.columns).lower()):
+            cols = table.column_names
+            if 'Year' in cols and ('production' in "".join(cols).lower() or 'prod' in "".join(cols).lower() or 'rain' in "".join(cols).lower()):
                 st.subheader("Chart")
                 try:
-                    fig, ax = plt.subplots(figsize=(8,3))
-                    # try to plot first numeric column vs Year
-                    ycol = [c for c in df.columns if c.lower() not in ('state','crop','metric') and df[c].dtype.kind in 'fi']
-                    if ycol:
-                        ax.plot(df['Year'], df[ycol[0]], marker='o')
-                        ax.set_xlabel('Year'); ax.set_ylabel(ycol[0])
-                        st.pyplot(fig)
+                    # native chart (no matplotlib figure per query)
+                    series, ycol = chart_series(result_key, data_version(), table)
+                    if series:
+                        st.line_chart(series, x='Year', y=ycol, height=260)
                 except Exception as e:
                     st.write("Could not plot:", e)
 
         # Extract sources/views from SQL for citations
-        def extract_sources_from_sql(q: str):
-            identifiers = set()
-            for m in re.finditer(r"\b(?:FROM|JOIN)\s+([a-zA-Z0-9_./]+)", q, re.IGNORECASE):
-                identifiers.add(m.group(1).split(" ")[0].strip())
-            return sorted(identifiers)
-
         sources = extract_sources_from_sql(sql)
         dataset_map = {
             "state_year_rain": "data/rain_state_year.parquet",
             "crop_state_year": "data/crop_state_year.parquet",
         }
 
-        # Compose narrative using LLM (compose only; send small summary)
-        try:
-            st.info("Composing narrative (LLM)...")
-            # prepare small factual summary to send
-            summary = df.head(50).to_dict(orient='records') if df is not None and not df.empty else []
-            prompt = f"""
-You are an assistant that composes short factual summaries for a Q&A app.
-Do NOT invent numbers. Use ONLY the facts provided in the 'facts' variable.
-facts = {summary}
-sql = {sql}
-question = {question}
-sources = {sources}
-Write a short answer (3-6 sentences). After each numeric claim, include a parenthetical citation like (source: <view-name>). Only use these sources: {sources}.
-Return only text.
-"""
-            answer_text = llm_generate_short(prompt)
-            st.subheader("Answer (composed by LLM)")
-            st.write(answer_text)
-        except Exception as e:
-            st.write("LLM composition skipped:", e)
+        # Compose narrative locally (deterministic, no network); the LLM only polishes it
+        if derived_sql:
+            # the table is a session-local narrowing, so it is not cached under (template, params)
+            answer_text = compose_narrative(template, table, params, sources)
+        else:
+            answer_text = cached_narrative(template, params, table, sql, read_version.get("v"))
+        answer_label = "Answer"
+        prompt_stats = {}
+        if polish and not offline:
+            try:
+                st.info("Polishing narrative (LLM)...")
+                # compact, token-budgeted facts instead of a raw row dump
+                prompt, prompt_stats = build_narrative_prompt(question, table, sql, sources, template, params, draft=answer_text)
+                st.caption(f"Prompt: ~{prompt_stats['prompt_tokens']} tokens, {prompt_stats['rows_sent']}/{prompt_stats['rows_in']} rows ({prompt_stats['facts_mode']})")
+                polished = llm_generate_short(prompt, fallback=answer_text)
+                if polished != answer_text:
+                    answer_text, answer_label = polished, "Answer (polished by LLM)"
+            except Exception as e:
+                st.write("LLM polish skipped:", e)
+        st.subheader(answer_label)
+        st.write(answer_text)
 
         # show data provenance
         st.subheader("Provenance")
@@ -110,9 +173,6 @@ Return only text.
 
         # Audit log write
         try:
-            os.makedirs("logs", exist_ok=True)
-            audit_path = os.path.join("logs", "audit.csv")
-            sql_hash = hashlib.sha256(sql.encode("utf-8")).hexdigest()
             payload = {
                 "timestamp": datetime.utcnow().isoformat() + "Z",
                 "question": question,
@@ -121,12 +181,10 @@ Return only text.
                 "sql_hash": sql_hash,
                 "sources": json.dumps(sources),
                 "offline": "1" if offline else "0",
+                "follow_up": ("rerun" if follow["reran"] else "session") if follow else "",
+                "prompt_tokens": prompt_stats.get("prompt_tokens", ""),
+                "prompt_chars": prompt_stats.get("prompt_chars", ""),
             }
-            write_header = not os.path.exists(audit_path)
-            with open(audit_path, "a", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=list(payload.keys()))
-                if write_header:
-                    writer.writeheader()
-                writer.writerow(payload)
+            append_audit(payload)
         except Exception as e:
             st.write("Audit log skipped:", e)
@@ -0,0 +1,199 @@
+# suggest.py
+"""
+Typeahead suggestions for the question box.
+
+Entities (distinct states, districts and crops in DuckDB) are held in a few
+numpy arrays instead of per-name Python objects:
+  - keys: lower-cased names as sorted fixed-width bytes; a prefix lookup is
+    two np.searchsorted calls
+  - trigram postings (CSR layout: sorted trigram keys, int32 offsets, int32
+    name ids) for infix and misspelt input, scored with np.bincount
+Question shapes come from nl_parser.QUESTION_SHAPES.
+
+The index is rebuilt when query_executor.data_version() changes. One caller
+rebuilds while the others keep answering from the previous index, which is
+then swapped in with a single assignment.
+"""
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+from query_executor import _connect, current_db_path, data_version
+
+SUGGEST_LIMIT = int(os.getenv("SUGGEST_LIMIT", "8"))
+# how often (seconds) a lookup checks whether the database version moved
+SUGGEST_RECHECK_S = float(os.getenv("SUGGEST_RECHECK_S", "1.0"))
+
+KINDS = ("state", "crop", "district")  # also the tie-break order in results
+
+def _trigrams(key: bytes) -> set:
+    padded = b"  " + key + b" "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class SuggestIndex:
+    """Immutable prefix + trigram index over (kind, name) pairs."""
+
+    def __init__(self, entries, version: str = ""):
+        self.version = version
+        # one entry per (kind, lower-cased name); the first spelling seen wins
+        seen = {}
+        for kind, name in entries:
+            name = " ".join(str(name or "").split())
+            if name and (kind, name.lower()) not in seen:
+                seen[(kind, name.lower())] = name
+        items = sorted(seen.items(), key=lambda kv: (kv[0][1], KINDS.index(kv[0][0])))
+        self.keys = np.array([k[1].encode("utf-8") for k, _ in items] or [b""], dtype=bytes)[:len(items)]
+        self.names = np.array([n.encode("utf-8") for _, n in items] or [b""], dtype=bytes)[:len(items)]
+        self.kinds = np.array([KINDS.index(k[0]) for k, _ in items], dtype=np.int8)
+        self.lengths = np.array([len(k) for k in self.keys], dtype=np.int16)
+
+        postings = {}
+        for i, key in enumerate(self.keys):
+            for g in _trigrams(bytes(key)):
+                postings.setdefault(g, []).append(i)
+        grams = sorted(postings)
+        self.grams = np.array(grams or [b""], dtype="S3")[:len(grams)]
+        self.offsets = np.zeros(len(grams) + 1, dtype=np.int32)
+        self.offsets[1:] = np.cumsum([len(postings[g]) for g in grams], dtype=np.int64)
+        self.postings = np.array([i for g in grams for i in postings[g]], dtype=np.int32)
+        self.n_grams = np.array([len(_trigrams(bytes(k))) for k in self.keys], dtype=np.int16)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix(self, text: str, kinds=None) -> np.ndarray:
+        """Ids of names starting with text (case-insensitive), shortest first."""
+        p = text.lower().encode("utf-8")
+        if not p or not len(self.keys) or len(p) > self.keys.dtype.itemsize:
+            return np.empty(0, dtype=np.int64)
+        lo = np.searchsorted(self.keys, p, side="left")
+        hi = np.searchsorted(self.keys, p + b"\xff", side="right")
+        ids = np.arange(lo, hi)
+        if kinds is not None:
+            ids = ids[np.isin(self.kinds[ids], kinds)]
+        return ids[np.argsort(self.lengths[ids], kind="stable")]
+
+    def fuzzy(self, text: str, kinds=None, min_score: float = 0.5):
+        """(ids, scores) of names sharing enough trigrams with text, best first."""
+        grams = _trigrams(text.lower().encode("utf-8"))
+        if len(text) < 3 or not len(self.grams):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        q = np.array(sorted(grams), dtype="S3")
+        pos = np.searchsorted(self.grams, q)
+        found = pos < len(self.grams)
+        pos, q = pos[found], q[found]
+        pos = pos[self.grams[pos] == q]
+        if not len(pos):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        hits = np.concatenate([self.postings[self.offsets[i]:self.offsets[i + 1]] for i in pos])
+        counts = np.bincount(hits, minlength=len(self.keys))
+        # Dice coefficient between the query's and the name's trigram sets
+        score = 2.0 * counts / (len(grams) + self.n_grams)
+        ids = np.nonzero(score >= min_score)[0]
+        if kinds is not None:
+            ids = ids[np.isin(self.kinds[ids], kinds)]
+        order = np.argsort(-score[ids], kind="stable")
+        return ids[order], score[ids][order]
+
+    def entry(self, i: int) -> dict:
+        return {"kind": KINDS[self.kinds[i]], "value": self.names[i].decode("utf-8")}
+
+def load_entries(path: str = None):
+    """Distinct (kind, name) pairs from whichever tables the database has."""
+    con = _connect(path)
+    try:
+        tables = {r[0] for r in con.execute(
+            "SELECT table_name FROM duckdb_tables() UNION SELECT view_name FROM duckdb_views()").fetchall()}
+        queries = []
+        for t in ("state_year_rain", "crop_state_year"):
+            if t in tables:
+                queries.append(f"SELECT DISTINCT 'state', State FROM {t}")
+        if "crop_state_year" in tables:
+            queries.append("SELECT DISTINCT 'crop', Crop FROM crop_state_year")
+        if "season_crop_clean" in tables:
+            queries.append("SELECT DISTINCT 'crop', Crop FROM season_crop_clean")
+            queries.append("SELECT DISTINCT 'district', District FROM season_crop_clean")
+        if not queries:
+            return []
+        return con.execute(" UNION ALL ".join(queries)).fetchall()
+    finally:
+        con.close()
+
+_index = None
+_checked_at = 0.0
+_build_lock = threading.Lock()
+
+def get_index() -> SuggestIndex:
+    """Current index; rebuilt (by one caller at a time) when the data version changes."""
+    global _index, _checked_at
+    now = time.monotonic()
+    if _index is not None and now - _checked_at < SUGGEST_RECHECK_S:
+        return _index
+    _checked_at = now
+    path = current_db_path()
+    version = data_version(path)
+    if _index is not None and _index.version == version:
+        return _index
+    # without an index every caller has to wait; otherwise serve the old one meanwhile
+    if _build_lock.acquire(blocking=_index is None):
+        try:
+            if _index is None or _index.version != version:
+                _index = SuggestIndex(load_entries(path), version)
+        finally:
+            _build_lock.release()
+    return _index
+
+# question shapes shown next to entity completions
+SHAPE_SLOTS = 2
+
+def _shape_matches(text: str, limit: int):
+    from nl_parser import QUESTION_SHAPES
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if not words or limit <= 0:
+        return []
+    scored = []
+    for key, shape in QUESTION_SHAPES.items():
+        shape_words = re.findall(r"[a-z0-9]+", shape.lower())
+        # the first word must open the shape's wording; the rest only need to appear in it
+        if not any(s.startswith(words[0]) for s in shape_words[:3]):
+            continue
+        share = sum(any(s.startswith(w) for s in shape_words) for w in words) / len(words)
+        if share >= 0.5:
+            scored.append((-share, len(scored), {"kind": "question", "value": shape, "template": key, "score": round(share, 3)}))
+    return [m for *_, m in sorted(scored)[:limit]]
+
+def suggest(text: str, limit: int = SUGGEST_LIMIT, kinds=None, index: SuggestIndex = None) -> list:
+    """
+    Suggestions for the text typed so far. Entity suggestions complete the
+    trailing fragment (up to three words, for names like "Uttar Pradesh") and
+    carry `start`, the offset in text where the completion replaces input.
+    """
+    if index is None:
+        index = get_index()
+    kind_ids = None if not kinds else [KINDS.index(k) for k in kinds if k in KINDS]
+    shapes = _shape_matches(text or "", min(SHAPE_SLOTS, limit)) if kinds is None or "question" in kinds else []
+    out, seen = [], set()
+    limit -= len(shapes)
+
+    def add(i, start, score):
+        if int(i) not in seen and len(out) < limit:
+            seen.add(int(i))
+            out.append({**index.entry(int(i)), "start": start, "score": round(float(score), 3)})
+
+    # longest trailing fragment with a prefix match wins, then fuzzy matches on the last word
+    words = list(re.finditer(r"\S+", text or ""))
+    for n in (3, 2, 1):
+        if len(words) < n:
+            continue
+        start = words[-n].start()
+        for i in index.prefix(text[start:].rstrip(), kind_ids):
+            add(i, start, 1.0)
+    if words:
+        last = words[-1]
+        ids, scores = index.fuzzy(last.group(0), kind_ids)
+        for i, s in zip(ids, scores):
+            add(i, last.start(), s)
+    return out + shapes